@@ -0,0 +1,241 @@
+"""
+Author: Bruce Smith
+Date: August 24, 2023
+"""
+import argparse
+import json
+import platform
+import sys
+import timeit
+from typing import Callable
+import numpy as np
+import torch
+from Game.simulation import SnakeSimulation
+from Game.snake import Snake
+from Game.vectorenv import VectorSnakeEnv
+from Model.dqnmodel import LinearDQN, QNNTrainer
+from Model.replaymemory import ReplayMemory
+from Model.tabularq import TabularQAgent
+
+BOARD_SIZES = ((16, 14), (32, 28), (64, 56))
+BATCH_SIZES = (1, 32, 256, 1024)
+
+
+def ops_per_sec(func: Callable[[], object], min_time: float = 0.2, repeat: int = 3) -> float:
+    """
+    Measure how many times per second a function runs, taking the best of several timings
+    :param func: function to call with no arguments
+    :param min_time: minimum seconds per timing
+    :param repeat: number of timings
+    :return: calls per second
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return number / min(timer.repeat(repeat, number))
+
+
+def serpentine(n_cols: int, n_rows: int, length: int) -> list[tuple[int, int]]:
+    """
+    Get the first cells of a path sweeping the board interior row by row
+    :param n_cols: number of cells across the board, including the border cells
+    :param n_rows: number of cells down the board, including the border cells
+    :param length: number of cells
+    :return: List of cell coordinates along the path
+    """
+    path = []
+    for y in range(1, n_rows - 1):
+        xs = range(1, n_cols - 1) if y % 2 else range(n_cols - 2, 0, -1)
+        path.extend((x, y) for x in xs)
+    return path[:length]
+
+
+def board_with_snake(n_cols: int, n_rows: int, length: int) -> SnakeSimulation:
+    """
+    Get a board with a snake of the given length coiled along the serpentine path
+    :param n_cols: number of cells across the board, including the border cells
+    :param n_rows: number of cells down the board, including the border cells
+    :param length: length of the snake, at least 2
+    :return: The board, with the snake's head at the end of the path
+    """
+    board = SnakeSimulation(n_cols, n_rows, seed=0)
+    board.place_snake(serpentine(n_cols, n_rows, length)[::-1])
+    return board
+
+
+def bench_simulation(min_time: float) -> dict[str, float]:
+    """
+    Measure the per-step game logic at several board sizes and snake lengths
+    :param min_time: minimum seconds per timing
+    :return: calls per second by benchmark name
+    """
+    results = {}
+    for n_cols, n_rows in BOARD_SIZES:
+        interior = (n_cols - 2) * (n_rows - 2)
+        for length in sorted({2, interior // 4, interior * 3 // 4}):
+            name = "{}x{}/len{}".format(n_cols, n_rows, length)
+            board = board_with_snake(n_cols, n_rows, length)
+            state = np.empty(11, dtype=int)
+            grid = np.empty((4, n_rows, n_cols), dtype=np.uint8)
+            results["is_collision/" + name] = ops_per_sec(lambda: board.is_collision(board.snake.head), min_time)
+            results["get_state/" + name] = ops_per_sec(lambda: board.get_state(state), min_time)
+            results["get_grid_state/" + name] = ops_per_sec(lambda: board.get_grid_state(grid), min_time)
+            results["new_apple_coords/" + name] = ops_per_sec(board._get_new_apple_coords, min_time)
+            # moving a detached snake straight on, so it never collides with anything
+            snake = board_with_snake(n_cols, n_rows, length).snake
+            results["snake_move/" + name] = ops_per_sec(lambda: snake.move(-1), min_time)
+    # growing a fresh snake by 1000 nodes at a time, so timing does not fill up memory
+    results["snake_extend_and_move"] = 1000 * ops_per_sec(lambda: grow(Snake(0, 0), 1000), min_time)
+    return results
+
+
+def grow(snake: Snake, n: int) -> Snake:
+    """
+    Extend a snake straight on
+    :param snake: snake to extend
+    :param n: number of nodes to add
+    :return: The snake
+    """
+    for _ in range(n):
+        snake.extend_and_move(-1)
+    return snake
+
+
+def bench_vector_env(min_time: float, n_envs: int = 256) -> dict[str, float]:
+    """
+    Measure the vectorized environment in game steps per second
+    :param min_time: minimum seconds per timing
+    :param n_envs: number of games stepped together
+    :return: game steps per second by benchmark name
+    """
+    results = {}
+    rng = np.random.default_rng(0)
+    actions = rng.integers(0, 3, (64, n_envs))
+    for observation in ("features", "grid"):
+        env = VectorSnakeEnv(n_envs, seed=0, observation=observation)
+        step = iter(range(sys.maxsize))
+        results["vector_env_step/{}/{}".format(observation, n_envs)] = n_envs * ops_per_sec(
+            lambda: env.step(actions[next(step) % len(actions)]), min_time)
+    return results
+
+
+def random_memory(capacity: int, state_n: int = 11) -> ReplayMemory:
+    """
+    Get a replay memory filled with random transitions
+    :param capacity: number of transitions
+    :param state_n: number of (binary) features in a state
+    :return: The full replay memory
+    """
+    rng = np.random.default_rng(0)
+    memory = ReplayMemory(capacity, state_n, seed=0)
+    memory.push_batch(rng.integers(0, 2, (capacity, state_n)), rng.integers(0, 3, capacity),
+                      rng.integers(0, 2, (capacity, state_n)), rng.integers(-10, 11, capacity),
+                      rng.random(capacity) < 0.05)
+    return memory
+
+
+def bench_replay_memory(min_time: float) -> dict[str, float]:
+    """
+    Measure replay memory writes and samples in transitions per second
+    :param min_time: minimum seconds per timing
+    :return: transitions per second by benchmark name
+    """
+    memory = random_memory(100000)
+    state = np.ones(11, dtype=int)
+    results = {"memory_push/1": ops_per_sec(lambda: memory.push(state, [0, 1, 0], state, 1, False), min_time)}
+    batch = memory.get_batch(np.arange(256))
+    results["memory_push_batch/256"] = 256 * ops_per_sec(
+        lambda: memory.push_batch(batch.state, batch.action, batch.next_state, batch.reward, batch.done), min_time)
+    for batch_size in BATCH_SIZES:
+        results["memory_sample/{}".format(batch_size)] = batch_size * ops_per_sec(
+            lambda: memory.sample(batch_size), min_time)
+    return results
+
+
+def bench_train_step(min_time: float) -> dict[str, float]:
+    """
+    Measure QNNTrainer.train_step, and TabularQAgent.train_batch as a baseline, in transitions per second
+    :param min_time: minimum seconds per timing
+    :return: transitions per second by benchmark name
+    """
+    torch.manual_seed(0)
+    trainer = QNNTrainer(LinearDQN(11, 256, 3), lr=0.001, gamma=0.97)
+    agent = TabularQAgent(seed=0)
+    memory = random_memory(10000)
+    results = {}
+    for batch_size in BATCH_SIZES:
+        batch = memory.sample(batch_size)
+        results["train_step/{}".format(batch_size)] = batch_size * ops_per_sec(
+            lambda: trainer.train_step(batch), min_time)
+        results["tabular_update/{}".format(batch_size)] = batch_size * ops_per_sec(
+            lambda: agent.train_batch(batch), min_time)
+    return results
+
+
+SUITES = {"simulation": bench_simulation,
+          "vector_env": bench_vector_env,
+          "replay_memory": bench_replay_memory,
+          "train_step": bench_train_step}
+
+
+def run(suites: list[str] = None, min_time: float = 0.2) -> dict:
+    """
+    Run benchmark suites
+    :param suites: names of the suites in SUITES to run, None for all of them
+    :param min_time: minimum seconds per timing
+    :return: dict of the machine description and the rate of every benchmark
+    """
+    torch.set_num_threads(1)
+    results = {}
+    for suite in suites or SUITES:
+        results.update(SUITES[suite](min_time))
+    return {"machine": {"python": platform.python_version(), "numpy": np.__version__,
+                        "torch": torch.__version__, "processor": platform.processor() or platform.machine()},
+            "results": results}
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], tolerance: float = 0.1) -> list[str]:
+    """
+    Print each benchmark's rate against a baseline
+    :param results: rates by benchmark name
+    :param baseline: baseline rates by benchmark name
+    :param tolerance: fraction a rate may drop below its baseline before it counts as a regression
+    :return: names of the benchmarks that regressed
+    """
+    regressions = []
+    for name, rate in results.items():
+        if name not in baseline:
+            print("{:<45} {:>14.0f} {:>14}".format(name, rate, "new"))
+            continue
+        ratio = rate / baseline[name]
+        flag = ""
+        if ratio < 1 - tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("{:<45} {:>14.0f} {:>14.0f} {:>7.2f}x{}".format(name, rate, baseline[name], ratio, flag))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the simulation and training hot paths")
+    parser.add_argument("--suite", action="append", choices=list(SUITES), help="suite to run, default all")
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds per timing")
+    parser.add_argument("--output", default=None, help="JSON file to write the results to")
+    parser.add_argument("--baseline", default=None, help="JSON file of earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="fraction a rate may drop below the baseline before failing")
+    args = parser.parse_args()
+
+    report = run(args.suite, args.min_time)
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.baseline is None:
+        for bench_name, bench_rate in report["results"].items():
+            print("{:<45} {:>14.0f}".format(bench_name, bench_rate))
+    else:
+        with open(args.baseline) as file:
+            baseline_report = json.load(file)
+        if compare(report["results"], baseline_report["results"], args.tolerance):
+            sys.exit(1)
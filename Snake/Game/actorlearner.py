@@ -0,0 +1,219 @@
+"""
+Author: Bruce Smith
+Date: August 24, 2023
+"""
+import argparse
+import copy
+import json
+import queue
+import time
+import torch
+import torch.multiprocessing as mp
+from torch import nn
+from Game.game import Game
+from Model.replaymemory import ReplayMemory
+from Model.snakedqn import SnakeDQN, DQNConfig
+
+
+def run_actor(shared_model: nn.Module, weights_version: mp.Value, weights_lock: mp.Lock,
+              transitions: mp.Queue, stop: mp.Event, width: int, height: int, chunk_size: int,
+              config: DQNConfig, grid_size: tuple[int, int] | None, max_idle_steps: int | None) -> None:
+    """
+    Play headless games with a local copy of the policy and send their transitions to the learner.
+    Runs in a worker process.
+    :param shared_model: model in shared memory holding the learner's latest weights
+    :param weights_version: number of times the learner has published weights
+    :param weights_lock: lock held while shared weights are read or written
+    :param transitions: queue of (score or None, records) messages to the learner
+    :param stop: set by the learner when the actors should exit
+    :param width: width of board
+    :param height: height of board
+    :param chunk_size: number of transitions sent per message, besides the last of each game
+    :param config: hyperparameters of the learner's DQN, for its architecture, exploration and n_step
+    :param grid_size: grid size of the learner's DQN, None if it learns from the 11 state features
+    :param max_idle_steps: end a game as lost after this many moves without eating, None for no limit
+    :return: None
+    """
+    torch.set_num_threads(1)
+    state_n = 11 if grid_size is None else 4 * grid_size[0] * grid_size[1]
+    # room for the n-step transitions flushed together at the end of a game
+    actor = SnakeDQN.from_config(config, memory=ReplayMemory(chunk_size + config.n_step, state_n),
+                                 grid_size=grid_size)
+    game = Game(width, height, dqn=actor, headless=True, learn=False,
+                observation="features" if grid_size is None else "grid", max_idle_steps=max_idle_steps)
+    version = -1
+
+    def send(score: int | None) -> bool:
+        """
+        Send the stored transitions to the learner and clear the local memory
+        :param score: final score if a game just ended, None otherwise
+        :return: False if the learner asked to stop while waiting, True otherwise
+        """
+        message = (score, actor.memory.records[:len(actor.memory)].copy())
+        actor.memory.position = actor.memory.size = 0
+        while not stop.is_set():
+            try:
+                transitions.put(message, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    running = True
+    while running and not stop.is_set():
+        # sync the policy with the learner between games
+        if weights_version.value != version:
+            with weights_lock:
+                version = weights_version.value
+                actor.model.load_state_dict(shared_model.state_dict())
+
+        while running and not game.game_over:
+            game.step()
+            if len(actor.memory) >= chunk_size and not game.game_over:
+                running = send(None)
+        running = running and send(game.score())
+        game.reset()
+    transitions.cancel_join_thread()
+
+
+class ActorLearner:
+    """
+    Trains a SnakeDQN with a pool of actor processes playing headless games and a single learner
+    (this process) training on batches of their transitions
+    """
+    def __init__(self, dqn: SnakeDQN, n_actors: int = 4, width: int = 800, height: int = 700,
+                 batch_size: int = 256, sync_every: int = 100, chunk_size: int = 256,
+                 log_every: int = 100, max_idle_steps: int = None) -> None:
+        """
+        Initialize the actor/learner pipeline
+        :param dqn: DQN agent trained by the learner
+        :param n_actors: number of actor processes
+        :param width: width of board
+        :param height: height of board
+        :param batch_size: number of transitions per gradient update
+        :param sync_every: number of gradient updates between publishing weights to the actors
+        :param chunk_size: number of transitions an actor sends at most per message
+        :param log_every: print a progress summary every N games, 0 to disable
+        :param max_idle_steps: end an actor's game as lost after this many moves without eating, None for twice
+            the number of cells of the board, 0 for no limit (see Game.idle_limit)
+        """
+        self.dqn = dqn
+        self.n_actors = n_actors
+        self.width = width
+        self.height = height
+        self.batch_size = batch_size
+        self.sync_every = sync_every
+        self.chunk_size = chunk_size
+        self.log_every = log_every
+        self.n_updates = 0
+        self.n_transitions = 0
+
+        n_cols, n_rows = Game.board_size(width, height)
+        if dqn.grid_size is not None and dqn.grid_size != (n_rows, n_cols):
+            raise ValueError("the DQN's grid size {} does not match a {}x{} board".format(dqn.grid_size, width, height))
+        # without a limit an actor whose policy loops without eating would never finish its game
+        self.max_idle_steps = Game.idle_limit(n_cols, n_rows, max_idle_steps)
+        self.context = mp.get_context("spawn")
+        # the same architecture as the learner's model, whatever its config
+        self.shared_model = copy.deepcopy(dqn.model)
+        self.shared_model.share_memory()
+        self.weights_version = self.context.Value("i", 0)
+        self.weights_lock = self.context.Lock()
+        self.transitions = self.context.Queue(maxsize=4 * n_actors)
+        self.stop = self.context.Event()
+        self.publish_weights()
+
+    def publish_weights(self) -> None:
+        """
+        Copy the learner's weights into shared memory for the actors to pick up
+        :return: None
+        """
+        with self.weights_lock:
+            self.shared_model.load_state_dict(self.dqn.model.state_dict())
+            self.weights_version.value += 1
+
+    def _receive(self) -> int:
+        """
+        Move every waiting message from the actors into replay memory
+        :return: number of transitions received
+        """
+        received = 0
+        while True:
+            try:
+                score, records = self.transitions.get_nowait()
+            except queue.Empty:
+                return received
+            self.dqn.memory.push_records(records)
+            received += len(records)
+            if score is not None:
+                self.dqn.n_game += 1
+                self.dqn.graph_results(score, False)
+                if self.log_every and self.dqn.n_game % self.log_every == 0:
+                    elapsed = time.perf_counter() - self.start_time
+                    print("Game {}: score {}, record {}, steps/sec {:.0f}, updates/sec {:.0f}".format(
+                        self.dqn.n_game, score, self.dqn.metrics.best,
+                        self.n_transitions / elapsed, self.n_updates / elapsed))
+
+    def run(self, n_games: int = None, n_steps: int = None) -> None:
+        """
+        Train until n_games games or n_steps transitions have been received from the actors
+        :param n_games: number of games to play, None for no limit
+        :param n_steps: number of transitions to receive, None for no limit
+        :return: None
+        """
+        actors = [self.context.Process(target=run_actor,
+                                       args=(self.shared_model, self.weights_version, self.weights_lock,
+                                             self.transitions, self.stop, self.width, self.height,
+                                             self.chunk_size, self.dqn.config, self.dqn.grid_size,
+                                             self.max_idle_steps),
+                                       daemon=True)
+                  for _ in range(self.n_actors)]
+        for actor in actors:
+            actor.start()
+
+        self.start_time = time.perf_counter()
+        start_games = self.dqn.n_game
+        try:
+            while ((n_games is None or self.dqn.n_game - start_games < n_games) and
+                   (n_steps is None or self.n_transitions < n_steps)):
+                self.n_transitions += self._receive()
+                if len(self.dqn.memory) < self.batch_size:
+                    time.sleep(0.001)
+                    continue
+                self.dqn.train_long_memory(self.batch_size)
+                self.n_updates += 1
+                if self.n_updates % self.sync_every == 0:
+                    self.publish_weights()
+        finally:
+            self.dqn.metrics.close()
+            self.stop.set()
+            for actor in actors:
+                actor.join(timeout=1)
+                if actor.is_alive():
+                    actor.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the Snake DQN with parallel actor processes")
+    parser.add_argument("--actors", type=int, default=mp.cpu_count() - 1, help="number of actor processes")
+    parser.add_argument("--games", type=int, default=None, help="number of games to train for")
+    parser.add_argument("--steps", type=int, default=None, help="number of transitions to train for")
+    parser.add_argument("--batch-size", type=int, default=256, help="transitions per gradient update")
+    parser.add_argument("--config", default=None,
+                        help="JSON file of DQNConfig hyperparameters, e.g. the best trial of Game.sweep")
+    parser.add_argument("--sync-every", type=int, default=100, help="gradient updates between weight syncs")
+    parser.add_argument("--log-every", type=int, default=100, help="print progress every N games")
+    parser.add_argument("--max-idle-steps", type=int, default=None,
+                        help="end a game as lost after this many moves without eating, "
+                             "default twice the board size, 0 for no limit")
+    args = parser.parse_args()
+
+    config = DQNConfig()
+    if args.config is not None:
+        with open(args.config) as file:
+            config = config._replace(**json.load(file))
+    dqn_snake = SnakeDQN.from_config(config)
+    learner = ActorLearner(dqn_snake, n_actors=max(args.actors, 1), batch_size=args.batch_size,
+                           sync_every=args.sync_every, log_every=args.log_every,
+                           max_idle_steps=args.max_idle_steps)
+    learner.run(n_games=args.games, n_steps=args.steps)
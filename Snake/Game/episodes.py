@@ -0,0 +1,106 @@
+"""
+Author: Bruce Smith
+Date: August 24, 2023
+"""
+import argparse
+import numpy as np
+from Game.simulation import SnakeSimulation, Episode, CLOCKWISE
+
+
+def save_episodes(path: str, episodes: list[Episode]) -> None:
+    """
+    Save episodes to a compressed .npz file of seeds, board sizes, starvation limits and the concatenated move codes
+    :param path: path of the .npz file
+    :param episodes: episodes to save, e.g. from SnakeSimulation.episode
+    :return: None
+    """
+    lengths = np.array([len(episode.moves) for episode in episodes], dtype=np.int64)
+    moves = np.frombuffer(b"".join(episode.moves for episode in episodes), dtype=np.uint8)
+    np.savez_compressed(path,
+                        seeds=np.array([episode.seed for episode in episodes], dtype=np.int64),
+                        sizes=np.array([(episode.n_cols, episode.n_rows) for episode in episodes],
+                                       dtype=np.int64).reshape(-1, 2),
+                        # 0 for no limit
+                        idle_limits=np.array([episode.max_idle_steps or 0 for episode in episodes], dtype=np.int64),
+                        offsets=np.concatenate(([0], np.cumsum(lengths))),
+                        moves=moves)
+
+
+def load_episodes(path: str) -> list[Episode]:
+    """
+    Load episodes saved by save_episodes
+    :param path: path of the .npz file
+    :return: List of episodes
+    """
+    with np.load(path) as data:
+        seeds, sizes, idle_limits = data["seeds"], data["sizes"], data["idle_limits"]
+        offsets, moves = data["offsets"], data["moves"]
+    return [Episode(int(seed), int(n_cols), int(n_rows), int(idle_limit) or None, moves[start:end].tobytes())
+            for seed, (n_cols, n_rows), idle_limit, start, end in zip(seeds, sizes, idle_limits, offsets[:-1],
+                                                                     offsets[1:])]
+
+
+def replay(episode: Episode, board: SnakeSimulation = None) -> SnakeSimulation:
+    """
+    Re-simulate an episode headlessly
+    :param episode: episode to play back
+    :param board: board to play it on, None for a new SnakeSimulation of the episode's size
+    :return: The board in the final position of the episode
+    """
+    if board is None:
+        board = SnakeSimulation(episode.n_cols, episode.n_rows)
+    # a game that starved ends on its last move only with the same limit
+    board.max_idle_steps = episode.max_idle_steps
+    board.reset(episode.seed)
+    for code in episode.moves:
+        board.step(CLOCKWISE[code])
+    return board
+
+
+def render(episode: Episode, cell_size: int = 50, move_ms: int = 100) -> None:
+    """
+    Play back an episode in a window
+    :param episode: episode to play back
+    :param cell_size: width and height of a cell in pixels
+    :param move_ms: milliseconds between moves
+    :return: None
+    """
+    # only a replay in a window needs pygame
+    import pygame
+    from Game.gameboard import GameBoard
+    pygame.init()
+    pygame.display.set_caption("Snake: replay of game {}".format(episode.seed))
+    board = GameBoard(episode.n_cols * cell_size, episode.n_rows * cell_size, cell_size,
+                      max_idle_steps=episode.max_idle_steps)
+    board.reset(episode.seed)
+    pygame.display.update(board.draw(False))
+
+    clock = pygame.time.Clock()
+    game_over = False
+    for code in episode.moves:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return
+        clock.tick(1000 / move_ms)
+        game_over = board.step(CLOCKWISE[code])
+        pygame.display.update(board.draw(game_over))
+
+    while not any(event.type in (pygame.QUIT, pygame.KEYDOWN) for event in pygame.event.get()):
+        clock.tick(30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay Snake games saved with save_episodes")
+    parser.add_argument("path", help=".npz file of episodes")
+    parser.add_argument("--render", type=int, default=None, help="draw the episode with this index")
+    parser.add_argument("--move-ms", type=int, default=100, help="milliseconds between moves when drawing")
+    args = parser.parse_args()
+
+    saved = load_episodes(args.path)
+    if args.render is not None:
+        render(saved[args.render], move_ms=args.move_ms)
+    else:
+        for i, saved_episode in enumerate(saved):
+            final = replay(saved_episode)
+            print("Episode {}: seed {}, moves {}, score {}, {}".format(
+                i, saved_episode.seed, len(saved_episode.moves), final.snake.get_score(), final.death_cause))
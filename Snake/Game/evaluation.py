@@ -0,0 +1,198 @@
+"""
+Author: Bruce Smith
+Date: August 24, 2023
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from typing import Callable
+import numpy as np
+from Game.simulation import SnakeSimulation, get_states
+from Model.numpypolicy import NumpyPolicy, LINEAR_DQN_KEYS
+from Model.tabularq import state_index
+
+DEATH_CAUSES = ("wall", "body", "starved", "won")
+ONE_HOT = np.eye(3, dtype=int)
+
+
+def load_policy(path: str) -> tuple[str, dict | np.ndarray]:
+    """
+    Load the parameters of a policy to evaluate, as picklable arrays for the worker processes
+    :param path: policy exported by Model.numpypolicy, TabularQAgent checkpoint or SnakeDQN checkpoint
+    :return: Tuple of the policy kind ("linear" or "tabular") and its weights dict or Q-table
+    """
+    try:
+        with np.load(path) as file:
+            if "q_table" in file.files:
+                return "tabular", file["q_table"]
+            if set(LINEAR_DQN_KEYS) <= set(file.files):
+                return "linear", {key: file[key] for key in LINEAR_DQN_KEYS}
+    except ValueError:
+        pass
+    # a torch checkpoint, only read here so the workers never import torch
+    import torch
+    state_dict = torch.load(path)["model"]
+    if set(state_dict) != set(LINEAR_DQN_KEYS):
+        raise ValueError("only linear DQN and tabular policies can be evaluated")
+    return "linear", {key: state_dict[key].numpy() for key in LINEAR_DQN_KEYS}
+
+
+def greedy_actions(policy: tuple[str, dict | np.ndarray]) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    Get a function picking the best action of each state, never exploring
+    :param policy: policy kind and parameters from load_policy
+    :return: function from a batch of states to action indices
+    """
+    kind, params = policy
+    if kind == "tabular":
+        return lambda states: np.argmax(params[state_index(states)], axis=1)
+    return NumpyPolicy(params, epsilon=0.0).get_actions
+
+
+def play_games(policy: tuple[str, dict | np.ndarray], seeds: list[int], n_cols: int, n_rows: int,
+               max_idle_steps: int, n_boards: int = 64) -> np.ndarray:
+    """
+    Play one seeded game per seed, stepping several boards in lockstep to batch the policy's forward passes.
+    Runs in a worker process.
+    :param policy: policy kind and parameters from load_policy
+    :param seeds: apple seed of each game
+    :param n_cols: number of cells across the board, including the border cells
+    :param n_rows: number of cells down the board, including the border cells
+    :param max_idle_steps: moves without eating after which a game counts as starved
+    :param n_boards: number of games played at once
+    :return: Array with a (seed, score, steps, death cause index) row per game
+    """
+    act = greedy_actions(policy)
+    results = np.zeros((len(seeds), 4), dtype=np.int64)
+    pending = iter(enumerate(seeds))
+    boards, slots = [], []
+    for i, seed in pending:
+        board = SnakeSimulation(n_cols, n_rows, max_idle_steps=max_idle_steps)
+        board.reset(seed)
+        boards.append(board)
+        slots.append(i)
+        if len(boards) == n_boards:
+            break
+    states = np.empty((len(boards), 11), dtype=int)
+
+    while boards:
+        actions = act(get_states(boards, states[:len(boards)]))
+        finished = []
+        for b, board in enumerate(boards):
+            if board.step(board.parse_dqn_action(ONE_HOT[actions[b]])):
+                results[slots[b]] = (board.seed, board.snake.get_score(), len(board.moves),
+                                     DEATH_CAUSES.index(board.death_cause))
+                finished.append(b)
+        # start the next games on the finished boards, dropping boards once no seeds are left
+        for b in reversed(finished):
+            following = next(pending, None)
+            if following is None:
+                del boards[b], slots[b]
+            else:
+                slots[b] = following[0]
+                boards[b].reset(following[1])
+    return results
+
+
+def _play_chunk(args: tuple) -> np.ndarray:
+    """
+    Unpack the arguments of play_games for Pool.imap_unordered
+    :param args: arguments of play_games
+    :return: Result of play_games
+    """
+    return play_games(*args)
+
+
+def evaluate(path: str, n_games: int = 1000, first_seed: int = 0, n_workers: int = None,
+             n_cols: int = 16, n_rows: int = 14, max_idle_steps: int = None) -> dict:
+    """
+    Play seeded games greedily with a policy across a process pool
+    :param path: policy to evaluate, see load_policy
+    :param n_games: number of games
+    :param first_seed: apple seed of the first game, the others follow consecutively
+    :param n_workers: number of worker processes, None for one per CPU
+    :param n_cols: number of cells across the board, including the border cells
+    :param n_rows: number of cells down the board, including the border cells
+    :param max_idle_steps: moves without eating after which a game counts as starved, None for twice the board size
+    :return: dict of the games ("seeds", "scores", "steps", "causes" arrays) and the wall time in "seconds"
+    """
+    policy = load_policy(path)
+    n_workers = n_workers or os.cpu_count()
+    max_idle_steps = max_idle_steps or 2 * n_cols * n_rows
+    seeds = np.arange(first_seed, first_seed + n_games)
+    chunks = [(policy, chunk.tolist(), n_cols, n_rows, max_idle_steps)
+              for chunk in np.array_split(seeds, min(n_games, 4 * n_workers))]
+
+    start_time = time.perf_counter()
+    with mp.get_context("spawn").Pool(n_workers) as pool:
+        results = np.concatenate(list(pool.imap_unordered(_play_chunk, chunks)))
+    elapsed = time.perf_counter() - start_time
+    results = results[np.argsort(results[:, 0])]
+    return {"seeds": results[:, 0], "scores": results[:, 1], "steps": results[:, 2], "causes": results[:, 3],
+            "seconds": elapsed}
+
+
+def summarize(games: dict) -> dict:
+    """
+    Summarize evaluated games
+    :param games: result of evaluate
+    :return: dict of score statistics, mean episode length, death cause shares and throughput
+    """
+    scores = games["scores"]
+    n = len(scores)
+    return {"games": n,
+            "mean_score": float(scores.mean()),
+            "score_stderr": float(scores.std(ddof=1) / np.sqrt(n)) if n > 1 else 0.0,
+            "score_percentiles": {str(q): float(v) for q, v in
+                                  zip((0, 10, 25, 50, 75, 90, 100), np.percentile(scores, (0, 10, 25, 50, 75, 90, 100)))},
+            "mean_steps": float(games["steps"].mean()),
+            "death_causes": {cause: float(np.mean(games["causes"] == i)) for i, cause in enumerate(DEATH_CAUSES)},
+            "steps_per_sec": float(games["steps"].sum() / games["seconds"]),
+            "games_per_sec": n / games["seconds"]}
+
+
+def print_summary(path: str, summary: dict) -> None:
+    """
+    Print a summary from summarize
+    :param path: policy the summary is for
+    :param summary: result of summarize
+    :return: None
+    """
+    print("{}: {} games".format(path, summary["games"]))
+    print("    score {:.2f} +/- {:.2f} (95% CI), percentiles {}".format(
+        summary["mean_score"], 1.96 * summary["score_stderr"],
+        ", ".join("{}%: {:g}".format(q, v) for q, v in summary["score_percentiles"].items())))
+    print("    mean steps {:.1f}, deaths {}".format(
+        summary["mean_steps"], ", ".join("{} {:.1%}".format(c, v) for c, v in summary["death_causes"].items())))
+    print("    {:.0f} steps/sec, {:.0f} games/sec".format(summary["steps_per_sec"], summary["games_per_sec"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate policies greedily on the same seeded games")
+    parser.add_argument("policies", nargs="+", help="exported policies (.npz), TabularQAgent or SnakeDQN checkpoints")
+    parser.add_argument("--games", type=int, default=1000, help="number of games per policy")
+    parser.add_argument("--seed", type=int, default=0, help="apple seed of the first game")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes, default one per CPU")
+    parser.add_argument("--max-idle-steps", type=int, default=None,
+                        help="steps without eating before a game counts as starved, default twice the board size")
+    parser.add_argument("--output", default=None, help="JSON file to write the summaries to")
+    args = parser.parse_args()
+
+    summaries = {}
+    baseline = None
+    for policy_path in args.policies:
+        evaluated = evaluate(policy_path, args.games, args.seed, args.workers, max_idle_steps=args.max_idle_steps)
+        summaries[policy_path] = summarize(evaluated)
+        print_summary(policy_path, summaries[policy_path])
+        if baseline is None:
+            baseline = evaluated
+        else:
+            # the games share their seeds, so compare policies game by game
+            diff = evaluated["scores"] - baseline["scores"]
+            print("    vs {}: {:+.2f} +/- {:.2f} (95% CI, paired)".format(
+                args.policies[0], diff.mean(), 1.96 * diff.std(ddof=1) / np.sqrt(len(diff)) if len(diff) > 1 else 0.0))
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(summaries, file, indent=2)
@@ -2,28 +2,105 @@
 Author: Bruce Smith
 Date: August 24, 2023
 """
+from collections import namedtuple
+from typing import TYPE_CHECKING
 import numpy as np
-import pygame
-from Game.gameboard import GameBoard
-from Model.snakedqn import SnakeDQN
+from Game.profiling import PhaseTimer
+from Game.simulation import SnakeSimulation
+from Model.replaymemory import NStepBuffer
+
+if TYPE_CHECKING:
+    # only for annotations, importing the agents here would import torch for every Game
+    from Model.snakedqn import SnakeDQN
+
+# When the DQN trains while it plays: on each move just made if short_memory is set, on `updates` batches
+# from replay memory every train_every moves (0 for never) once the memory holds `warmup` transitions,
+# and on game_over_updates batches after each game. The defaults are the original schedule.
+TrainingSchedule = namedtuple('TrainingSchedule', ('short_memory', 'train_every', 'updates', 'game_over_updates',
+                                                   'warmup'),
+                              defaults=(True, 0, 1, 1, 0))
 
 
 class Game:
     """ Game class to run the game """
-    def __init__(self, width: int = 800, height: int = 700, dqn: SnakeDQN = None) -> None:
+    def __init__(self, width: int = 800, height: int = 700, dqn: "SnakeDQN" = None,
+                 headless: bool = False, cell_size: int = 50, learn: bool = True,
+                 observation: str = "features", seed: int = None, timer: PhaseTimer = None,
+                 max_idle_steps: int = None, schedule: TrainingSchedule = TrainingSchedule()) -> None:
         """
         Initialize the game
         :param width: width of board
         :param height: height of board
+        :param dqn: DQN agent (or TabularQAgent or NumpyPolicy) to play the game, None to play yourself
+        :param headless: True to simulate the game without opening a window
+        :param cell_size: width and height of a cell in pixels
+        :param learn: False to only store the DQN's transitions without training on them
+        :param observation: "features" to give the DQN the 11 get_state features, "grid" for get_grid_state planes
+        :param seed: seed the apple seed of every game is drawn from, None for a random seed
+        :param timer: PhaseTimer to time each phase of a step with, None to not time them
+        :param max_idle_steps: end a game as lost after this many moves without eating, None for no limit
+        :param schedule: when the DQN trains, see TrainingSchedule
         """
         self.width = width
         self.height = height
-        self.board = GameBoard(width, height)
+        self.cell_size = cell_size
+        self.headless = headless
+        if headless:
+            self.board = SnakeSimulation(*self.board_size(width, height, cell_size), seed, max_idle_steps)
+        else:
+            # pygame is only imported for games drawn in a window
+            from Game.gameboard import GameBoard
+            self.board = GameBoard(width, height, cell_size, seed, max_idle_steps)
         self.key_cmd = -1
         self.game_over = False
 
         self.dqn = dqn
         self.qnn_play = False if dqn is None else True
+        self.learn = learn
+        self.timer = timer
+        self.schedule = schedule
+        self.n_moves = 0
+        # transitions go to replay memory directly, or summed over the DQN's n_step moves first
+        self.transitions = None
+        if dqn is not None and dqn.memory is not None:
+            self.transitions = (NStepBuffer(dqn.memory, dqn.n_step, dqn.gamma) if dqn.n_step > 1
+                                else dqn.memory)
+        # two state buffers: the state before a move and the state after it, which is reused
+        # as the state before the next move
+        if observation == "grid":
+            self.get_state = self.board.get_grid_state
+            shape, dtype = (4, self.board.n_rows, self.board.n_cols), np.uint8
+        else:
+            self.get_state = self.board.get_state
+            shape, dtype = (11,), int
+        self.state_buffers = (np.zeros(shape, dtype=dtype), np.zeros(shape, dtype=dtype))
+        self.next_state = None
+
+    @staticmethod
+    def board_size(width: int, height: int, cell_size: int = 50) -> tuple[int, int]:
+        """
+        Get the number of cells of the board a game of the given size plays on
+        :param width: width of board
+        :param height: height of board
+        :param cell_size: width and height of a cell in pixels
+        :return: Tuple of the number of cells across and down the board, including the border cells
+        """
+        return width // cell_size, height // cell_size
+
+    @staticmethod
+    def idle_limit(n_cols: int, n_rows: int, max_idle_steps: int = None) -> int | None:
+        """
+        Get the starvation limit training games play with
+        :param n_cols: number of cells across the board, including the border cells
+        :param n_rows: number of cells down the board, including the border cells
+        :param max_idle_steps: moves without eating before a game is lost, None for twice the number of cells,
+            0 for no limit
+        :return: moves without eating before a game is lost, None for no limit
+        """
+        if max_idle_steps is None:
+            # long enough to reach the apple from anywhere, short enough to end a policy that loops
+            return 2 * n_cols * n_rows
+        return max_idle_steps or None
 
     def score(self) -> int:
         """
@@ -37,9 +114,12 @@ class Game:
         Reset/restart the game
         :return: None
         """
-        self.board = GameBoard(self.width, self.height)
+        self.board.reset()
+        if isinstance(self.transitions, NStepBuffer):
+            self.transitions.clear()
         self.key_cmd = -1
         self.game_over = False
+        self.next_state = None
 
     def dqn_pre_move(self) -> tuple[int, np.ndarray, list[int], float]:
         """
@@ -49,7 +129,9 @@ class Game:
         """
         # pre-move characteristics
         score = self.score()
-        state = self.board.get_state()
+        state = self.next_state
+        if state is None:
+            state = self.get_state(self.state_buffers[0])
         action = self.dqn.get_action(state)
         head_to_apple = self.board.distance_head_to_apple()
         self.key_cmd = self.board.parse_dqn_action(action)
@@ -65,11 +147,16 @@ class Game:
         :return: None
         """
         # get next score, next state, and reward
-        next_state = self.board.get_state()
+        buffer = self.state_buffers[1] if state is self.state_buffers[0] else self.state_buffers[0]
+        next_state = self.get_state(buffer)
+        self.next_state = None if self.game_over else next_state
         next_score = self.score()
         next_head_to_apple = self.board.distance_head_to_apple()
         done = False
-        if self.game_over:
+        if self.board.won:
+            reward = 10
+            done = True
+        elif self.game_over:
             reward = -10
             done = True
         elif next_score - score > 0:
@@ -79,16 +166,67 @@ class Game:
         else:
             reward = 0
 
-        self.dqn.train_short_memory(state, action, next_state, reward, done)
-        self.dqn.memory.push(state, action, next_state, reward, done)
+        schedule = self.schedule
+        if self.learn and schedule.short_memory:
+            self.dqn.train_short_memory(state, action, next_state, reward, done)
+        if self.transitions is not None:
+            self.transitions.push(state, action, next_state, reward, done)
+        self.n_moves += 1
+        if (self.learn and schedule.train_every and self.n_moves % schedule.train_every == 0 and
+                self.dqn.memory is not None and len(self.dqn.memory) >= max(schedule.warmup, 1)):
+            for _ in range(schedule.updates):
+                self.dqn.train_long_memory()
+
+    def step(self) -> None:
+        """
+        Advance the game by one move, training the DQN if it is playing
+        :return: None
+        """
+        timer = self.timer
+        if timer is not None:
+            timer.mark()
+        # DQN pre-move
+        if self.qnn_play:
+            score, state, action, head_to_apple = self.dqn_pre_move()
+            if timer is not None:
+                timer.lap("pre_move")
+        # normal game procedure
+        self.game_over = self.board.step(self.key_cmd)
+        if timer is not None:
+            timer.lap("game")
+        # DQN post-move
+        if self.qnn_play:
+            self.dqn_post_move(score, state, action, head_to_apple)
+            if timer is not None:
+                timer.lap("post_move")
+
+        self.key_cmd = -1
+
+    def end_game(self, plot: bool = True) -> None:
+        """
+        Record the finished game, restart and train the DQN with a memory sample
+        :param plot: True to graph the results, False to only record them
+        :return: None
+        """
+        self.dqn.n_game += 1
+        self.dqn.graph_results(self.score(), plot)
+        self.reset()
+        if self.timer is not None:
+            self.timer.mark()
+        for _ in range(self.schedule.game_over_updates):
+            self.dqn.train_long_memory()
+        if self.timer is not None:
+            self.timer.lap("train_long")
 
     def play(self) -> None:
         """
-        Run the game
+        Run the game, printing a timing summary after each game if the game has a timer
         :return: None
         """
+        if self.headless:
+            raise RuntimeError("A headless game cannot be played in a window")
+        import pygame
         pygame.init()
-        self.board = GameBoard()
         pygame.display.set_caption("Snake: version by Bruce Smith")
 
         # define move event timer
@@ -109,36 +247,35 @@ class Game:
                     self.reset()
                 if not self.game_over:
                     if event.type == MOVEEVENT:
-                        # DQN pre-move
-                        if self.qnn_play:
-                            score, state, action, head_to_apple = self.dqn_pre_move()
-                        # normal game procedure
-                        if self.board.apple_collision():
-                            self.game_over = not self.board.extend_and_move_snake(self.key_cmd)
-                        else:
-                            self.game_over = not self.board.move_snake(self.key_cmd)
-                        # DQN post-move
-                        if self.qnn_play:
-                            self.dqn_post_move(score, state, action, head_to_apple)
-
-                        self.key_cmd = -1
-
-            self.board.draw(self.game_over)
+                        self.step()
+
+            if self.timer is not None:
+                self.timer.mark()
+            dirty = self.board.draw(self.game_over)
+            pygame.display.update(dirty)
+            if self.timer is not None:
+                self.timer.lap("render")
+
             # If game_over, graph game results and train qnn with memory sample
             if self.qnn_play and self.game_over:
-                self.dqn.n_game += 1
-                self.dqn.graph_results(self.score())
-                self.reset()
-                self.dqn.train_long_memory()
-
-            pygame.display.update()
+                self.end_game()
+                if self.timer is not None:
+                    print("Game {}: {}".format(self.dqn.n_game, self.timer.summary(train_steps=self.dqn.n_train_steps)))
+                    self.timer.reset(self.dqn.n_train_steps)
 
 
 if __name__ == "__main__":
     dqn_play = True
-    if dqn_play:
+    # set to a policy exported with Model.numpypolicy to watch it play, without importing torch
+    policy_path = None
+    if policy_path is not None:
+        from Model.numpypolicy import NumpyPolicy
+        game = Game(dqn=NumpyPolicy(policy_path))
+        game.play()
+    elif dqn_play:
+        from Model.snakedqn import SnakeDQN, DQNConfig
         # Train Deep-Q neural network to play the game
-        dqn_snake = SnakeDQN(lr=0.001, gamma=0.97)
+        dqn_snake = SnakeDQN.from_config(DQNConfig(lr=0.001, gamma=0.97))
         game = Game(dqn=dqn_snake)
         game.play()
     else:
@@ -3,262 +3,180 @@ Author: Bruce Smith
 Date: August 24, 2023
 """
 import pygame
-from Game.snake import Snake, Apple
-from Game.cellitem import CellItem
-import random
-import numpy as np
+from Game.simulation import SnakeSimulation
 
 
-class GameBoard:
+class GameBoard(SnakeSimulation):
     """
-    GameBoard class
+    GameBoard class, a SnakeSimulation that is drawn to a pygame window.
+    The grid is pre-rendered to a background surface and each frame only redraws the cells whose
+    contents changed since the last frame, returning their rectangles for pygame.display.update.
     """
-    def __init__(self, width: int = 800, height: int = 700, cell_size: int = 50) -> None:
+    def __init__(self, width: int = 800, height: int = 700, cell_size: int = 50, seed: int = None,
+                 max_idle_steps: int = None) -> None:
         """
         Initialize the GameBoard
         :param height: height of window
         :param width: width of window
+        :param cell_size: width and height of a cell in pixels
+        :param seed: seed the seed of every game is drawn from, None for a random seed
+        :param max_idle_steps: end a game as starved after this many moves without eating, None for no limit
         """
+        super().__init__(width // cell_size, height // cell_size, seed, max_idle_steps)
         self.screen = pygame.display.set_mode((width, height))
         self.width = width
         self.height = height
         self.cell_size = cell_size
-        self.snake = Snake(int(width/(cell_size*2)) - 2, int(height/(cell_size*2)))
-        self.apple = Apple(self.snake.head.x + 3, self.snake.head.y)
         self.colors = {"white": (255, 255, 255),
                        "black": (0, 0, 0),
                        "light_green": (48, 222, 112),
                        "dark_green": (16, 120, 47),
                        "crimson": (220, 20, 60)}
-
-    def draw(self, game_over: bool) -> None:
-        """
-        Draw all board objects, draw game over screen if game_over
+        self.background = self._render_background()
+        # what is drawn in each non-empty cell on screen: "head", "body", "apple" or "head+apple"
+        self._drawn = {}
+        self._score_rect = None
+        self._drawn_score = None
+        self._full_redraw = True
+        # fonts by size and rendered text by (text, size, background color), created on first use
+        self._fonts = {}
+        self._texts = {}
+
+    def draw(self, game_over: bool) -> list[pygame.Rect]:
+        """
+        Draw all board objects that changed since the last frame, draw game over screen if game_over
         :param game_over: True if game_over, False otherwise
-        :return: None
+        :return: List of screen rectangles that changed, to pass to pygame.display.update
         """
-        self._draw_grid()
-        self._draw_snake()
-        self._draw_apple()
-        self._draw_score()
         if game_over:
-            self._draw_game_over()
-
-    def move_snake(self, key_cmd: int) -> bool:
-        """
-        Update the snakes positions
-        :param key_cmd: pygame constant int to relay key pressed
-        :return: True if snake position updated, False otherwise
-        """
-        if not self.is_collision(self.snake.head):
-            self.snake.move(key_cmd)
-            self.draw(False)
-            return not self.is_collision(self.snake.head)
-        else:
-            return False
-
-    def extend_and_move_snake(self, key_cmd: int) -> bool:
-        """
-        Extend and update the snakes position
-        :param key_cmd: pygame constant int to relay key pressed
-        :return: True if snake position, False otherwise
-        """
-        if not self.is_collision(self.snake.head):
-            self.snake.extend_and_move(key_cmd)
-            self.apple.set_coordinates(self._get_new_apple_coords())
-            self.snake.increment_score()
-            self.draw(False)
-            return not self.is_collision(self.snake.head)
-        else:
-            return False
-
-    def apple_collision(self) -> bool:
-        """
-        Check if snake head collided with apple
-        :return: True if collisions occurred, False otherwise
-        """
-        return self.snake.head.get_coordinates() == self.apple.get_coordinates()
-
-    def is_collision(self, item: CellItem) -> bool:
-        """
-        Check if there is a collision
-        :return: True if collision, False otherwise
-        """
-        snake_coords = self.snake.get_coordinates_list()
-        border_collision = not (0 < item.x < (self.width-self.cell_size)/self.cell_size and
-                                0 < item.y < (self.height-self.cell_size)/self.cell_size)
-        body_collision = item.get_coordinates() in snake_coords[1:]
-        return border_collision or body_collision
-
-    def _draw_game_over(self) -> None:
-        """
-        Draw the game over text
-        :return: None
-        """
-        font = pygame.font.Font('freesansbold.ttf', 64)
-        text = font.render("GAME OVER", True, self.colors["white"], self.colors["black"])
-        text_rect = text.get_rect()
-        text_rect.center = (self.width / 2, self.height / 2 - self.cell_size*2)
-        self.screen.blit(text, text_rect)
-
-        font = pygame.font.Font('freesansbold.ttf', 32)
-        text = font.render("Score: {}".format(self.snake.get_score()), True, self.colors["white"], self.colors["black"])
-        text_rect = text.get_rect()
-        text_rect.center = (self.width / 2, self.height / 2)
-        self.screen.blit(text, text_rect)
-
-        font = pygame.font.Font('freesansbold.ttf', 32)
-        text = font.render("R to restart           Q to quit".format(self.snake.get_score()), True, self.colors["white"], self.colors["black"])
-        text_rect = text.get_rect()
-        text_rect.center = (self.width / 2, self.height / 2 + self.cell_size)
-        self.screen.blit(text, text_rect)
-
-    def _get_new_apple_coords(self) -> tuple[int, int]:
-        """
-        Get coordinates for new apple location
-        :return: Tuple of coordinates
-        """
-        new_coords = (random.randint(1, int((self.width-self.cell_size)/self.cell_size - 1)),
-                      random.randint(1, int((self.height-self.cell_size)/self.cell_size - 1)))
-        while new_coords in self.snake.get_coordinates_list():
-            new_coords = (random.randint(1, int((self.width-self.cell_size)/self.cell_size - 1)),
-                          random.randint(1, int((self.height-self.cell_size)/self.cell_size - 1)))
-        return new_coords
-
-    def _draw_grid(self) -> None:
-        """
-        Draw the grid
-        :return: None
-        """
-        self.screen.fill(self.colors["black"])
+            if self._full_redraw:
+                return []
+            # the game over screen covers the board, repaint everything once it is gone
+            self._full_redraw = True
+            return self._draw_game_over()
+
+        if self._full_redraw:
+            self.screen.blit(self.background, (0, 0))
+            self._drawn = {}
+            self._drawn_score = None
+            self._score_rect = None
+        dirty = self._draw_cells()
+        dirty.extend(self._draw_score(dirty))
+        if self._full_redraw:
+            self._full_redraw = False
+            return [self.screen.get_rect()]
+        return dirty
+
+    def _render_background(self) -> pygame.Surface:
+        """
+        Draw the empty grid once to a surface the same size as the screen
+        :return: background surface
+        """
+        background = pygame.Surface((self.width, self.height))
+        background.fill(self.colors["black"])
         for x in range(self.cell_size, self.width-self.cell_size, self.cell_size):
             for y in range(self.cell_size, self.height-self.cell_size, self.cell_size):
                 rect = pygame.Rect(x, y, self.cell_size, self.cell_size)
-                pygame.draw.rect(self.screen, self.colors["light_green"], rect, 1)
-
-    def _draw_snake(self) -> None:
+                pygame.draw.rect(background, self.colors["light_green"], rect, 1)
+        return background
+
+    def _text(self, text: str, size: int, background: str = None) -> pygame.Surface:
+        """
+        Get rendered text, rendering it only the first time it is asked for
+        :param text: text to render
+        :param size: font size
+        :param background: name of background color, None for a transparent background
+        :return: text surface
+        """
+        key = (text, size, background)
+        surface = self._texts.get(key)
+        if surface is None:
+            font = self._fonts.get(size)
+            if font is None:
+                font = self._fonts[size] = pygame.font.Font('freesansbold.ttf', size)
+            surface = font.render(text, True, self.colors["white"],
+                                  None if background is None else self.colors[background])
+            self._texts[key] = surface
+        return surface
+
+    def _draw_game_over(self) -> list[pygame.Rect]:
         """
-        Draw the snake
-        :return: None
-        """
-        coordinates = self.snake.get_coordinates_list()
-        for x, y in coordinates:
-            rect = pygame.Rect(x*self.cell_size, y*self.cell_size, self.cell_size, self.cell_size)
-            if (x, y) == coordinates[0]:
+        Draw the game over text
+        :return: List of screen rectangles drawn
+        """
+        lines = (("YOU WIN" if self.won else "GAME OVER", 64, -self.cell_size*2),
+                 ("Score: {}".format(self.snake.get_score()), 32, 0),
+                 ("R to restart           Q to quit", 32, self.cell_size))
+        dirty = []
+        for line, size, offset in lines:
+            text = self._text(line, size, "black")
+            text_rect = text.get_rect()
+            text_rect.center = (self.width / 2, self.height / 2 + offset)
+            dirty.append(self.screen.blit(text, text_rect))
+        return dirty
+
+    def _cell_rect(self, coords: tuple[int, int]) -> pygame.Rect:
+        """
+        Get the screen rectangle of a cell
+        :param coords: tuple of coordinates (x, y)
+        :return: screen rectangle of the cell
+        """
+        return pygame.Rect(coords[0]*self.cell_size, coords[1]*self.cell_size, self.cell_size, self.cell_size)
+
+    def _draw_cell(self, coords: tuple[int, int], item: str | None) -> pygame.Rect:
+        """
+        Draw a single cell over the background
+        :param coords: tuple of coordinates (x, y)
+        :param item: "head", "body", "apple", a snake part under the apple such as "head+apple",
+            or None for an empty cell
+        :return: screen rectangle of the cell
+        """
+        rect = self._cell_rect(coords)
+        self.screen.blit(self.background, rect, rect)
+        if item is not None:
+            if item.startswith("head"):
                 pygame.draw.rect(self.screen, self.colors["light_green"], rect)
-            else:
+            elif item.startswith("body"):
                 pygame.draw.rect(self.screen, self.colors["dark_green"], rect)
-
-    def _draw_apple(self) -> None:
-        """
-        Draw apple
-        :return: None
-        """
-        coords = self.apple.get_coordinates()
-        pygame.draw.circle(self.screen, self.colors["crimson"],
-                           (coords[0]*self.cell_size + 0.5*self.cell_size, coords[1]*self.cell_size + 0.5*self.cell_size),
-                           self.cell_size/2)
-
-    def _draw_score(self) -> None:
-        """
-        Draw score
-        :return: None
-        """
-        font = pygame.font.Font('freesansbold.ttf', 32)
-        text = font.render("Score: {}".format(self.snake.get_score()), True, self.colors["white"])
-        text_rect = text.get_rect()
-        text_rect.center = (self.width/2, self.cell_size/2)
+            if item.endswith("apple"):
+                pygame.draw.circle(self.screen, self.colors["crimson"], rect.center, self.cell_size/2)
+        return rect
+
+    def _draw_cells(self) -> list[pygame.Rect]:
+        """
+        Redraw the cells whose snake or apple contents changed since the last frame
+        :return: List of screen rectangles drawn
+        """
+        cells = dict.fromkeys(self.snake.body, "body")
+        cells[self.snake.head.get_coordinates()] = "head"
+        # the apple is drawn on top of the snake part it shares a cell with
+        apple = self.apple.get_coordinates()
+        cells[apple] = "apple" if apple not in cells else cells[apple] + "+apple"
+
+        drawn = self._drawn
+        dirty = [self._draw_cell(coords, cells.get(coords)) for coords in drawn.keys() | cells.keys()
+                 if drawn.get(coords) != cells.get(coords)]
+        self._drawn = cells
+        return dirty
+
+    def _draw_score(self, dirty: list[pygame.Rect]) -> list[pygame.Rect]:
+        """
+        Draw score if it changed or cells under it were redrawn
+        :param dirty: screen rectangles already redrawn this frame
+        :return: List of screen rectangles drawn
+        """
+        score = self.snake.get_score()
+        if score == self._drawn_score and self._score_rect.collidelist(dirty) == -1:
+            return []
+        text = self._text("Score: {}".format(score), 32)
+        text_rect = text.get_rect(center=(self.width/2, self.cell_size/2))
+        # clear the old text and redraw the cells under it before drawing the new text
+        area = text_rect.copy() if self._score_rect is None else text_rect.union(self._score_rect)
+        self.screen.blit(self.background, area, area)
+        for coords, item in self._drawn.items():
+            if area.colliderect(self._cell_rect(coords)):
+                area.union_ip(self._draw_cell(coords, item))
         self.screen.blit(text, text_rect)
-
-# **********************************
-# Functions for Deep Q-learning network
-# **********************************
-
-    def get_state(self) -> np.ndarray:
-        """
-        Get current state of the board
-        :return: A numpy array of ints describing the board state
-        """
-        head = self.snake.head
-
-        pt_l = CellItem(head.x - 1, head.y)
-        pt_r = CellItem(head.x + 1, head.y)
-        pt_u = CellItem(head.x, head.y - 1)
-        pt_d = CellItem(head.x, head.y + 1)
-
-        dir_l = self.snake.prev_dir == pygame.K_LEFT
-        dir_r = self.snake.prev_dir == pygame.K_RIGHT
-        dir_u = self.snake.prev_dir == pygame.K_UP
-        dir_d = self.snake.prev_dir == pygame.K_DOWN
-
-        state = [
-            # Danger Straight
-            (dir_u and self.is_collision(pt_u)) or
-            (dir_d and self.is_collision(pt_d)) or
-            (dir_l and self.is_collision(pt_l)) or
-            (dir_r and self.is_collision(pt_r)),
-
-            # Danger right
-            (dir_u and self.is_collision(pt_r)) or
-            (dir_d and self.is_collision(pt_l)) or
-            (dir_l and self.is_collision(pt_u)) or
-            (dir_r and self.is_collision(pt_d)),
-
-            # Danger Left
-            (dir_u and self.is_collision(pt_l)) or
-            (dir_d and self.is_collision(pt_r)) or
-            (dir_l and self.is_collision(pt_d)) or
-            (dir_r and self.is_collision(pt_u)),
-
-            # Move Direction
-            dir_u,
-            dir_d,
-            dir_l,
-            dir_r,
-
-            # Food Location
-            self.apple.x < head.x,  # food is in left
-            self.apple.x > head.x,  # food is in right
-            self.apple.y < head.y,  # food is up
-            self.apple.y > head.y  # food is down
-        ]
-        return np.array(state, dtype=int)
-
-    def parse_dqn_action(self, action: list[int]) -> int:
-        """
-        Get a key_cmd from a given action list
-        :param action: List of ints specifying the action
-        :return: The key_cmd
-        """
-        key_cmd = -1
-        if np.argmax(action) == 0:
-            key_cmd = -1
-        elif np.argmax(action) == 1:
-            match self.snake.prev_dir:
-                case pygame.K_RIGHT:
-                    key_cmd = pygame.K_DOWN
-                case pygame.K_LEFT:
-                    key_cmd = pygame.K_UP
-                case pygame.K_UP:
-                    key_cmd = pygame.K_RIGHT
-                case pygame.K_DOWN:
-                    key_cmd = pygame.K_LEFT
-        elif np.argmax(action) == 2:
-            match self.snake.prev_dir:
-                case pygame.K_RIGHT:
-                    key_cmd = pygame.K_UP
-                case pygame.K_LEFT:
-                    key_cmd = pygame.K_DOWN
-                case pygame.K_UP:
-                    key_cmd = pygame.K_LEFT
-                case pygame.K_DOWN:
-                    key_cmd = pygame.K_RIGHT
-        return key_cmd
-
-    def distance_head_to_apple(self) -> float:
-        """
-        Get the euclidean distance between the snake head and apple
-        :return: euclidean distance
-        """
-        return np.sqrt((self.snake.head.x - self.apple.x)**2 +
-                       (self.snake.head.y - self.apple.y)**2)
+        self._score_rect = text_rect
+        self._drawn_score = score
+        return [area]
@@ -0,0 +1,12 @@
+"""
+Author: Bruce Smith
+Date: August 24, 2023
+"""
+# pygame's key codes for the keys the game uses, copied here so the snake and the simulation
+# never import pygame; only drawing and reading the keyboard (GameBoard, Game.play) need it
+K_UP = 1073741906
+K_DOWN = 1073741905
+K_RIGHT = 1073741903
+K_LEFT = 1073741904
+K_q = 113
+K_r = 114
@@ -0,0 +1,90 @@
+"""
+Author: Bruce Smith
+Date: August 24, 2023
+"""
+import cProfile
+import pstats
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class PhaseTimer:
+    """
+    Accumulates wall time per phase of the game loop (e.g. pre_move, game, post_move, render, train_long).
+    Code being timed calls mark() where a phase starts and lap(phase) where it ends; loops hold None
+    instead of a timer when timing is off, so it costs nothing unless enabled.
+    """
+    def __init__(self) -> None:
+        """
+        Initialize the timer
+        """
+        self.totals = {}
+        self.counts = {}
+        self.last = time.perf_counter()
+        self.reset()
+
+    def reset(self, train_steps: int = 0) -> None:
+        """
+        Clear the accumulated times and restart the summary clock
+        :param train_steps: current number of train steps, to report train steps/sec from
+        :return: None
+        """
+        self.totals.clear()
+        self.counts.clear()
+        self.start_time = time.perf_counter()
+        self.start_train_steps = train_steps
+
+    def mark(self) -> None:
+        """
+        Start timing a phase
+        :return: None
+        """
+        self.last = time.perf_counter()
+
+    def lap(self, phase: str) -> None:
+        """
+        Add the time since the last mark or lap to a phase, and start timing the next phase
+        :param phase: name of the phase that just ended
+        :return: None
+        """
+        now = time.perf_counter()
+        self.totals[phase] = self.totals.get(phase, 0.0) + now - self.last
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+        self.last = now
+
+    def summary(self, steps_phase: str = "game", train_steps: int = None) -> str:
+        """
+        Describe the throughput and the mean latency and share of time of each phase since the last reset
+        :param steps_phase: phase timed once per game step, to report steps/sec from
+        :param train_steps: current number of train steps, None to leave out train steps/sec
+        :return: one line summary
+        """
+        elapsed = time.perf_counter() - self.start_time
+        parts = ["steps/sec {:.0f}".format(self.counts.get(steps_phase, 0) / elapsed)]
+        if train_steps is not None:
+            parts.append("train steps/sec {:.0f}".format((train_steps - self.start_train_steps) / elapsed))
+        for phase, total in self.totals.items():
+            parts.append("{} {:.3f} ms ({:.0%})".format(phase, 1000 * total / self.counts[phase], total / elapsed))
+        return ", ".join(parts)
+
+
+@contextmanager
+def profile(path: str = None, top: int = 20) -> Iterator[cProfile.Profile | None]:
+    """
+    Run the enclosed code under cProfile, saving the stats and printing the slowest functions at the end
+    :param path: file to save the stats to (view with pstats or snakeviz), None to not profile
+    :param top: number of functions to print, sorted by cumulative time
+    :return: Context manager yielding the profiler, or None when not profiling
+    """
+    if path is None:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
@@ -0,0 +1,260 @@
+"""
+Author: Bruce Smith
+Date: August 24, 2023
+"""
+import argparse
+import json
+import time
+from Game.episodes import save_episodes
+from Game.game import Game, TrainingSchedule
+from Game.profiling import PhaseTimer, profile
+from Model.snakedqn import SnakeDQN, DQNConfig
+from Model.tabularq import TabularQAgent, TABULAR_CONFIG
+from Model.replaymemory import MemmapReplayMemory
+
+
+class TrainingRunner:
+    """
+    Runs DQN training as fast as the CPU allows, without the MOVEEVENT timer of Game.play.
+    Use Game.play to watch the agent in real time instead.
+    """
+    def __init__(self, dqn: SnakeDQN | TabularQAgent, width: int = 800, height: int = 700, cell_size: int = 50,
+                 render_every_game: int = 0, render_every_step: int = 0,
+                 plot: bool = False, log_every: int = 100, checkpoint_path: str = None,
+                 checkpoint_every: int = 0, checkpoint_memory: bool = False,
+                 observation: str = "features", seed: int = None, episodes_path: str = None,
+                 timing: bool = False, max_idle_steps: int = None,
+                 schedule: TrainingSchedule = TrainingSchedule()) -> None:
+        """
+        Initialize the training runner
+        :param dqn: DQN agent to train
+        :param width: width of board
+        :param height: height of board
+        :param cell_size: width and height of a cell in pixels
+        :param render_every_game: draw every step of every Nth game, 0 to never render whole games
+        :param render_every_step: draw every Nth step, 0 to never render on a step cadence
+        :param plot: True to graph results in a separate process as Game.play does
+        :param log_every: print a progress summary every N games, 0 to disable
+        :param checkpoint_path: where to save checkpoints, None to never save
+        :param checkpoint_every: save a checkpoint every N games, 0 to only save at the end of the run
+        :param checkpoint_memory: True to include the replay memory in checkpoints
+        :param observation: "features" or "grid", the states the DQN learns from (see Game)
+        :param seed: seed the apple seed of every game is drawn from, None for a random seed
+        :param episodes_path: .npz file to save a replayable log of every game to (see Game.episodes), None to keep none
+        :param timing: True to time each phase of the loop and add the timings to the progress summary
+        :param max_idle_steps: end a game as lost after this many moves without eating, None for twice the number
+            of cells of the board, 0 for no limit (see Game.idle_limit)
+        :param schedule: when the DQN trains, see TrainingSchedule
+        """
+        self.dqn = dqn
+        self.render_every_game = render_every_game
+        self.render_every_step = render_every_step
+        self.plot = plot
+        self.log_every = log_every
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_memory = checkpoint_memory
+        self.rendering = render_every_game > 0 or render_every_step > 0
+        self.timer = PhaseTimer() if timing else None
+        max_idle_steps = Game.idle_limit(*Game.board_size(width, height, cell_size), max_idle_steps)
+        self.game = Game(width, height, dqn=dqn, headless=not self.rendering, cell_size=cell_size,
+                         observation=observation, seed=seed, timer=self.timer, max_idle_steps=max_idle_steps,
+                         schedule=schedule)
+        if seed is not None:
+            # a resumed agent plays on with the game seeds an uninterrupted seeded run would have reached
+            self.game.board.skip_games(dqn.n_game)
+        self.n_steps = 0
+        self.episodes_path = episodes_path
+        self.episodes = []
+
+    def _should_render(self) -> bool:
+        """
+        Check if the current step is drawn
+        :return: True if the step should be drawn, False otherwise
+        """
+        if self.render_every_game and self.dqn.n_game % self.render_every_game == 0:
+            return True
+        return bool(self.render_every_step) and self.n_steps % self.render_every_step == 0
+
+    def run(self, n_games: int = None, n_steps: int = None) -> None:
+        """
+        Train until n_games games or n_steps steps have been played, or the window is closed
+        :param n_games: number of games to play, None for no limit
+        :param n_steps: number of steps to play, None for no limit
+        :return: None
+        """
+        if self.rendering:
+            import pygame
+            pygame.init()
+            pygame.display.set_caption("Snake: version by Bruce Smith")
+
+        try:
+            self._run(n_games, n_steps)
+        finally:
+            if self.checkpoint_path is not None:
+                self.dqn.save_checkpoint(self.checkpoint_path, self.checkpoint_memory)
+            self.dqn.metrics.close()
+            if self.episodes_path is not None:
+                save_episodes(self.episodes_path, self.episodes)
+
+    def _run(self, n_games: int, n_steps: int) -> None:
+        """
+        Training loop of run
+        :param n_games: number of games to play, None for no limit
+        :param n_steps: number of steps to play, None for no limit
+        :return: None
+        """
+        if self.rendering:
+            import pygame
+        start_time = time.perf_counter()
+        start_steps = self.n_steps
+        games_played = 0
+        while (n_games is None or games_played < n_games) and (n_steps is None or self.n_steps < n_steps):
+            self.game.step()
+            self.n_steps += 1
+
+            if self.rendering and self._should_render():
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        return
+                pygame.display.update(self.game.board.draw(self.game.game_over))
+                if self.timer is not None:
+                    self.timer.lap("render")
+
+            if self.game.game_over:
+                score = self.game.score()
+                if self.episodes_path is not None:
+                    self.episodes.append(self.game.board.episode())
+                self.game.end_game(self.plot)
+                games_played += 1
+                if (self.checkpoint_path is not None and self.checkpoint_every and
+                        self.dqn.n_game % self.checkpoint_every == 0):
+                    self.dqn.save_checkpoint(self.checkpoint_path, self.checkpoint_memory)
+                if self.log_every and self.dqn.n_game % self.log_every == 0:
+                    elapsed = time.perf_counter() - start_time
+                    print("Game {}: score {}, record {}, steps/sec {:.0f}".format(
+                        self.dqn.n_game, score, self.dqn.metrics.best,
+                        (self.n_steps - start_steps) / elapsed))
+                    if self.timer is not None:
+                        print("    " + self.timer.summary(train_steps=self.dqn.n_train_steps))
+                        self.timer.reset(self.dqn.n_train_steps)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the Snake DQN without the real-time move timer")
+    parser.add_argument("--games", type=int, default=None, help="number of games to train for")
+    parser.add_argument("--steps", type=int, default=None, help="number of steps to train for")
+    parser.add_argument("--render-every-game", type=int, default=0, help="draw every Nth game")
+    parser.add_argument("--render-every-step", type=int, default=0, help="draw every Nth step")
+    parser.add_argument("--plot", action="store_true", help="graph results in a separate process")
+    parser.add_argument("--metrics", default=None, help="CSV or JSONL file to log game results to")
+    parser.add_argument("--log-every", type=int, default=100, help="print progress every N games")
+    parser.add_argument("--config", default=None,
+                        help="JSON file of DQNConfig hyperparameters, e.g. the best trial of Game.sweep")
+    parser.add_argument("--lr", type=float, default=None, help="learning rate, overriding --config")
+    parser.add_argument("--gamma", type=float, default=None, help="discount rate, overriding --config")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="transitions per replay batch, overriding --config")
+    parser.add_argument("--n-step", type=int, default=None,
+                        help="sum the rewards of this many moves into each replayed transition, overriding --config")
+    parser.add_argument("--train-every", type=int, default=0,
+                        help="train on replay batches every N moves, 0 to only train on them after each game")
+    parser.add_argument("--updates", type=int, default=1, help="replay batches trained on every --train-every moves")
+    parser.add_argument("--game-over-updates", type=int, default=1, help="replay batches trained on after each game")
+    parser.add_argument("--warmup", type=int, default=0,
+                        help="transitions in replay memory before training on it every --train-every moves")
+    parser.add_argument("--no-short-memory", action="store_true", help="do not train on each move as it is made")
+    parser.add_argument("--prioritized", action="store_true", default=None, help="use prioritized experience replay")
+    parser.add_argument("--memory-path", default=None,
+                        help="keep replay memory in this memory-mapped file, resuming it if it exists")
+    parser.add_argument("--target-sync", type=int, default=None,
+                        help="train steps between target network copies, 0 for no target network")
+    parser.add_argument("--tau", type=float, default=None, help="soft-update the target network at this rate")
+    parser.add_argument("--double", action="store_true", default=None, help="use Double-DQN targets")
+    parser.add_argument("--tabular", action="store_true", help="train a Q-table instead of the neural network")
+    parser.add_argument("--grid", action="store_true", help="learn from board planes with a convolutional DQN")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible runs")
+    parser.add_argument("--episodes", default=None, help=".npz file to save a replayable log of every game to")
+    parser.add_argument("--width", type=int, default=800, help="width of the board in pixels")
+    parser.add_argument("--height", type=int, default=700, help="height of the board in pixels")
+    parser.add_argument("--cell-size", type=int, default=50, help="width and height of a cell in pixels")
+    parser.add_argument("--max-idle-steps", type=int, default=None,
+                        help="end a game as lost after this many moves without eating, "
+                             "default twice the board size, 0 for no limit")
+    parser.add_argument("--timing", action="store_true", help="time each phase of the loop in the progress summary")
+    parser.add_argument("--profile", default=None, help="run under cProfile and save the stats to this file")
+    parser.add_argument("--export-policy", default=None,
+                        help="after training, save the weights to this .npz file for Model.numpypolicy")
+    parser.add_argument("--checkpoint", default=None, help="save checkpoints to this path")
+    parser.add_argument("--checkpoint-every", type=int, default=0, help="save a checkpoint every N games")
+    parser.add_argument("--checkpoint-memory", action="store_true", help="include replay memory in checkpoints")
+    parser.add_argument("--resume", action="store_true",
+                        help="resume training from --checkpoint, with the hyperparameters saved in it")
+    args = parser.parse_args()
+
+    agent_class = TabularQAgent if args.tabular else SnakeDQN
+    config = TABULAR_CONFIG if args.tabular else DQNConfig()
+    if args.config is not None:
+        with open(args.config) as file:
+            config = config._replace(**json.load(file))
+    # flags given on the command line take precedence over the config file
+    overrides = {name: value for name, value in (
+        ("lr", args.lr), ("gamma", args.gamma), ("batch_size", args.batch_size), ("n_step", args.n_step),
+        ("prioritized", args.prioritized), ("target_sync", args.target_sync), ("tau", args.tau),
+        ("double", args.double)) if value is not None}
+    config = config._replace(**overrides)
+    if args.resume:
+        if args.checkpoint is None:
+            parser.error("--resume requires --checkpoint")
+        # the model is rebuilt with the saved hyperparameters, so it fits the saved weights
+        saved_config = agent_class.checkpoint_config(args.checkpoint)
+        if saved_config is not None:
+            # a config file has to match the saved one in full, flags only in the fields they set
+            given = config._asdict() if args.config is not None else overrides
+            conflicts = ["{}={} (saved {})".format(name, value, getattr(saved_config, name))
+                         for name, value in given.items() if value != getattr(saved_config, name)]
+            if conflicts:
+                parser.error("the hyperparameters conflict with those saved in {}: {}".format(
+                    args.checkpoint, ", ".join(conflicts)))
+            config = saved_config
+
+    if args.memory_path is not None and config.prioritized:
+        parser.error("--memory-path cannot be combined with --prioritized")
+    if args.tabular and args.grid:
+        parser.error("--tabular learns from the 11 state features and cannot be combined with --grid")
+    if args.export_policy is not None and (args.tabular or args.grid):
+        parser.error("--export-policy only exports the linear DQN")
+    n_cols, n_rows = Game.board_size(args.width, args.height, args.cell_size)
+    grid_size = (n_rows, n_cols) if args.grid else None
+    memory = None
+    if args.memory_path is not None:
+        try:
+            memory = MemmapReplayMemory(args.memory_path, config.memory_capacity,
+                                        state_n=4 * grid_size[0] * grid_size[1] if args.grid else 11,
+                                        seed=None if args.seed is None else args.seed + 1, n_step=config.n_step)
+        except ValueError as error:
+            parser.error("--memory-path {}, pass --n-step to match it".format(error))
+    if args.tabular:
+        try:
+            dqn_snake = TabularQAgent.from_config(config, memory=memory, metrics_path=args.metrics, seed=args.seed)
+        except ValueError as error:
+            parser.error(str(error))
+    else:
+        dqn_snake = SnakeDQN.from_config(config, memory=memory, metrics_path=args.metrics, grid_size=grid_size,
+                                         seed=args.seed)
+    if args.resume:
+        dqn_snake.load_checkpoint(args.checkpoint)
+    runner = TrainingRunner(dqn_snake, args.width, args.height, args.cell_size,
+                            render_every_game=args.render_every_game,
+                            render_every_step=args.render_every_step,
+                            plot=args.plot, log_every=args.log_every, checkpoint_path=args.checkpoint,
+                            checkpoint_every=args.checkpoint_every, checkpoint_memory=args.checkpoint_memory,
+                            observation="grid" if args.grid else "features", seed=args.seed,
+                            episodes_path=args.episodes, timing=args.timing,
+                            max_idle_steps=args.max_idle_steps,
+                            schedule=TrainingSchedule(not args.no_short_memory, args.train_every, args.updates,
+                                                      args.game_over_updates, args.warmup))
+    with profile(args.profile):
+        runner.run(n_games=args.games, n_steps=args.steps)
+    if args.export_policy is not None:
+        dqn_snake.export_policy(args.export_policy)
@@ -0,0 +1,381 @@
+"""
+Author: Bruce Smith
+Date: August 24, 2023
+"""
+from Game import keys
+from Game.snake import Snake, Apple
+from Game.cellitem import CellItem
+from collections import namedtuple
+import random
+import numpy as np
+
+# directions in clockwise order, so turning right is the next one and turning left the previous one
+CLOCKWISE = (keys.K_UP, keys.K_RIGHT, keys.K_DOWN, keys.K_LEFT)
+DELTA_X = (0, 1, 0, -1)
+DELTA_Y = (-1, 0, 1, 0)
+# index of each direction in CLOCKWISE, the code a move is logged as
+DIRECTION_CODES = {key: code for code, key in enumerate(CLOCKWISE)}
+
+# a played game: its apple seed, board size, starvation limit (None for none) and the direction code of every move
+# (see Game.episodes)
+Episode = namedtuple('Episode', ('seed', 'n_cols', 'n_rows', 'max_idle_steps', 'moves'))
+
+
+class SnakeSimulation:
+    """
+    Display-free simulation of the snake game (board, snake, apple, collisions and state).
+    Never imports pygame, so it can be stepped on machines without a display and starts quickly.
+    """
+    def __init__(self, n_cols: int = 16, n_rows: int = 14, seed: int = None, max_idle_steps: int = None) -> None:
+        """
+        Initialize the simulation
+        :param n_cols: number of cells across the board, including the border cells
+        :param n_rows: number of cells down the board, including the border cells
+        :param seed: seed the seed of every game is drawn from, None for a random seed
+        :param max_idle_steps: end a game as starved after this many moves without eating, None for no limit
+        """
+        self.n_cols = n_cols
+        self.n_rows = n_rows
+        self.max_idle_steps = max_idle_steps
+        self._seeds = random.Random(seed)
+        self.rng = random.Random()
+        # board planes of snake, head, apple and neck cells (see get_grid_state), updated cell by cell as
+        # the snake moves and the apple is placed
+        self.grid = np.zeros((4, n_rows, n_cols), dtype=np.uint8)
+        self.reset()
+
+    def reset(self, seed: int = None) -> None:
+        """
+        Reset the simulation to a new game
+        :param seed: seed for the apple placements of the game, None to draw the next one
+        :return: None
+        """
+        self.seed = self._seeds.getrandbits(32) if seed is None else seed
+        self.rng.seed(self.seed)
+        self.moves = bytearray()
+        self.snake = Snake(self.n_cols // 2 - 2, self.n_rows // 2)
+        self.apple = Apple(self.snake.head.x + 3, self.snake.head.y)
+        self.won = False
+        # why the game ended: "wall", "body", "starved" or "won", None while it is running
+        self.death_cause = None
+        self.idle_steps = 0
+
+        self._index_free_cells()
+        self._draw_grid()
+        if self.apple.get_coordinates() not in self._free_index:
+            # the starting apple is past the wall on boards too small for it
+            new_coords = self._get_new_apple_coords()
+            if new_coords is not None:
+                self.place_apple(new_coords)
+
+    def skip_games(self, n_games: int) -> None:
+        """
+        Move on to the game n_games resets later, as if reset had been called that many times, without
+        setting up the games in between; e.g. to continue a seeded run resumed after that many games
+        :param n_games: number of games to move on by
+        :return: None
+        """
+        if n_games <= 0:
+            return
+        for _ in range(n_games - 1):
+            self._seeds.getrandbits(32)
+        self.reset()
+
+    def place_snake(self, cells: list[tuple[int, int]]) -> None:
+        """
+        Replace the snake with one covering the given cells, e.g. to set up a position for a benchmark.
+        The snake heads on in the direction from its neck to its head, and an apple it covers is moved.
+        :param cells: cells of the snake from head to tail, at least two, each next to the one before
+        :return: None
+        """
+        (head_x, head_y), (neck_x, neck_y) = cells[0], cells[1]
+        snake = Snake.from_cells(cells)
+        snake.prev_dir = CLOCKWISE[list(zip(DELTA_X, DELTA_Y)).index((head_x - neck_x, head_y - neck_y))]
+        self.snake = snake
+        self._index_free_cells()
+        self._draw_grid()
+        if self.apple.get_coordinates() in snake.occupancy:
+            new_coords = self._get_new_apple_coords()
+            if new_coords is not None:
+                self.place_apple(new_coords)
+
+    def place_apple(self, coords: tuple[int, int]) -> None:
+        """
+        Move the apple to the given cell
+        :param coords: tuple of coordinates (x, y)
+        :return: None
+        """
+        self.grid[2, self.apple.y, self.apple.x] = 0
+        self.apple.set_coordinates(coords)
+        self.grid[2, self.apple.y, self.apple.x] = 1
+
+    def _index_free_cells(self) -> None:
+        """
+        Rebuild the free cells from the snake's position
+        :return: None
+        """
+        # interior cells not covered by the snake, with each cell's position in the list
+        self._free_cells = [(x, y) for x in range(1, self.n_cols - 1) for y in range(1, self.n_rows - 1)
+                            if (x, y) not in self.snake.occupancy]
+        self._free_index = {coords: i for i, coords in enumerate(self._free_cells)}
+
+    def _draw_grid(self) -> None:
+        """
+        Redraw the board planes from the snake's and the apple's positions
+        :return: None
+        """
+        grid = self.grid
+        grid[:] = 0
+        body = np.array(self.snake.body)
+        grid[0, body[:, 1], body[:, 0]] = 1
+        grid[1, self.snake.head.y, self.snake.head.x] = 1
+        grid[2, self.apple.y, self.apple.x] = 1
+        grid[3, body[1, 1], body[1, 0]] = 1
+
+    def _draw_move(self, head: tuple[int, int], neck: tuple[int, int]) -> None:
+        """
+        Update the board planes for the snake's new head, the old one becoming the neck
+        :param head: coordinates of the head before the move
+        :param neck: coordinates of the neck before the move
+        :return: None
+        """
+        grid = self.grid
+        grid[3, neck[1], neck[0]] = 0
+        grid[3, head[1], head[0]] = 1
+        grid[1, head[1], head[0]] = 0
+        grid[1, self.snake.head.y, self.snake.head.x] = 1
+        grid[0, self.snake.head.y, self.snake.head.x] = 1
+
+    def step(self, key_cmd: int) -> bool:
+        """
+        Advance the game by one move, extending the snake if it is on the apple
+        :param key_cmd: key code (see Game.keys) to relay key pressed
+        :return: True if the game is over (lost, starved, or won by filling the board), False otherwise
+        """
+        if self.apple_collision():
+            game_over = not self.extend_and_move_snake(key_cmd)
+            self.idle_steps = 0
+        else:
+            game_over = not self.move_snake(key_cmd)
+            self.idle_steps += 1
+        self.moves.append(DIRECTION_CODES[self.snake.prev_dir])
+        if not game_over and self.max_idle_steps is not None and self.idle_steps > self.max_idle_steps:
+            self.death_cause = "starved"
+            return True
+        if game_over:
+            head = self.snake.head
+            if self.won:
+                self.death_cause = "won"
+            elif 0 < head.x < self.n_cols - 1 and 0 < head.y < self.n_rows - 1:
+                self.death_cause = "body"
+            else:
+                self.death_cause = "wall"
+        return game_over
+
+    def move_snake(self, key_cmd: int) -> bool:
+        """
+        Update the snakes positions
+        :param key_cmd: key code (see Game.keys) to relay key pressed
+        :return: True if snake position updated, False otherwise
+        """
+        if not self.is_collision(self.snake.head):
+            head, neck, tail = self.snake.body[0], self.snake.body[1], self.snake.body[-1]
+            self.snake.move(key_cmd)
+            if tail not in self.snake.occupancy:
+                self.grid[0, tail[1], tail[0]] = 0
+                self._mark_free(tail)
+            self._draw_move(head, neck)
+            self._mark_taken(self.snake.head.get_coordinates())
+            return not self.is_collision(self.snake.head)
+        else:
+            return False
+
+    def extend_and_move_snake(self, key_cmd: int) -> bool:
+        """
+        Extend and update the snakes position
+        :param key_cmd: key code (see Game.keys) to relay key pressed
+        :return: True if snake position, False otherwise
+        """
+        if not self.is_collision(self.snake.head):
+            head, neck = self.snake.body[0], self.snake.body[1]
+            self.snake.extend_and_move(key_cmd)
+            self._draw_move(head, neck)
+            self._mark_taken(self.snake.head.get_coordinates())
+            self.snake.increment_score()
+            new_coords = self._get_new_apple_coords()
+            if new_coords is None:
+                # no free cell left for an apple, the board is full
+                self.won = not self.is_collision(self.snake.head)
+                return False
+            self.place_apple(new_coords)
+            return not self.is_collision(self.snake.head)
+        else:
+            return False
+
+    def apple_collision(self) -> bool:
+        """
+        Check if snake head collided with apple
+        :return: True if collisions occurred, False otherwise
+        """
+        return self.snake.head.get_coordinates() == self.apple.get_coordinates()
+
+    def is_collision(self, item: CellItem) -> bool:
+        """
+        Check if there is a collision
+        :return: True if collision, False otherwise
+        """
+        border_collision = not (0 < item.x < self.n_cols - 1 and
+                                0 < item.y < self.n_rows - 1)
+        return border_collision or self.snake.in_body(item.get_coordinates())
+
+    def _get_new_apple_coords(self) -> tuple[int, int] | None:
+        """
+        Get coordinates for new apple location
+        :return: Tuple of coordinates, None if the snake covers every cell
+        """
+        if not self._free_cells:
+            return None
+        return self._free_cells[self.rng.randrange(len(self._free_cells))]
+
+    def episode(self) -> Episode:
+        """
+        Get the log of the game so far, which Game.episodes.replay plays back exactly
+        :return: Episode of the game's seed, board size, starvation limit and moves
+        """
+        return Episode(self.seed, self.n_cols, self.n_rows, self.max_idle_steps, bytes(self.moves))
+
+    def _mark_free(self, coords: tuple[int, int]) -> None:
+        """
+        Add a cell the snake left to the free cells, unless it is a border cell
+        :param coords: tuple of coordinates (x, y)
+        :return: None
+        """
+        x, y = coords
+        # on small boards the starting tail, or a snake set by place_snake, can cover the border
+        if not (0 < x < self.n_cols - 1 and 0 < y < self.n_rows - 1):
+            return
+        self._free_index[coords] = len(self._free_cells)
+        self._free_cells.append(coords)
+
+    def _mark_taken(self, coords: tuple[int, int]) -> None:
+        """
+        Remove a cell the snake entered from the free cells by swapping it with the last one
+        :param coords: tuple of coordinates (x, y)
+        :return: None
+        """
+        idx = self._free_index.pop(coords, None)
+        if idx is None:
+            return
+        last = self._free_cells.pop()
+        if last != coords:
+            self._free_cells[idx] = last
+            self._free_index[last] = idx
+
+# **********************************
+# Functions for Deep Q-learning network
+# **********************************
+
+    def get_state(self, out: np.ndarray = None) -> np.ndarray:
+        """
+        Get current state of the board
+        :param out: preallocated array of 11 ints to write the state into, None to allocate one
+        :return: A numpy array of ints describing the board state
+        """
+        if out is None:
+            out = np.empty(11, dtype=int)
+        x, y = self.snake.head.x, self.snake.head.y
+        apple_x, apple_y = self.apple.x, self.apple.y
+        direction = CLOCKWISE.index(self.snake.prev_dir)
+        out[:] = [
+            # Danger straight, right and left
+            self._is_blocked(x + DELTA_X[direction], y + DELTA_Y[direction]),
+            self._is_blocked(x + DELTA_X[(direction + 1) % 4], y + DELTA_Y[(direction + 1) % 4]),
+            self._is_blocked(x + DELTA_X[(direction + 3) % 4], y + DELTA_Y[(direction + 3) % 4]),
+
+            # Move Direction (up, down, left, right)
+            direction == 0,
+            direction == 2,
+            direction == 3,
+            direction == 1,
+
+            # Food Location
+            apple_x < x,  # food is in left
+            apple_x > x,  # food is in right
+            apple_y < y,  # food is up
+            apple_y > y  # food is down
+        ]
+        return out
+
+    def get_grid_state(self, out: np.ndarray = None) -> np.ndarray:
+        """
+        Get the board as planes of cells: snake, head, apple and neck (the cell behind the head, giving the direction).
+        self.grid holds the same planes without a copy, valid until the next move.
+        :param out: preallocated uint8 array of shape (4, n_rows, n_cols) to copy the planes into, None to allocate one
+        :return: A numpy array of 0/1 cells with shape (4, n_rows, n_cols)
+        """
+        if out is None:
+            return self.grid.copy()
+        out[:] = self.grid
+        return out
+
+    def _is_blocked(self, x: int, y: int) -> bool:
+        """
+        Check if a cell next to the head is a wall or part of the body
+        :param x: width index of cell
+        :param y: height index of cell
+        :return: True if moving into the cell is a collision, False otherwise
+        """
+        return not (0 < x < self.n_cols - 1 and 0 < y < self.n_rows - 1) or (x, y) in self.snake.occupancy
+
+    def parse_dqn_action(self, action: list[int]) -> int:
+        """
+        Get a key_cmd from a given action list
+        :param action: List of ints specifying the action
+        :return: The key_cmd
+        """
+        key_cmd = -1
+        if np.argmax(action) == 0:
+            key_cmd = -1
+        elif np.argmax(action) == 1:
+            match self.snake.prev_dir:
+                case keys.K_RIGHT:
+                    key_cmd = keys.K_DOWN
+                case keys.K_LEFT:
+                    key_cmd = keys.K_UP
+                case keys.K_UP:
+                    key_cmd = keys.K_RIGHT
+                case keys.K_DOWN:
+                    key_cmd = keys.K_LEFT
+        elif np.argmax(action) == 2:
+            match self.snake.prev_dir:
+                case keys.K_RIGHT:
+                    key_cmd = keys.K_UP
+                case keys.K_LEFT:
+                    key_cmd = keys.K_DOWN
+                case keys.K_UP:
+                    key_cmd = keys.K_LEFT
+                case keys.K_DOWN:
+                    key_cmd = keys.K_RIGHT
+        return key_cmd
+
+    def distance_head_to_apple(self) -> float:
+        """
+        Get the euclidean distance between the snake head and apple
+        :return: euclidean distance
+        """
+        return np.sqrt((self.snake.head.x - self.apple.x)**2 +
+                       (self.snake.head.y - self.apple.y)**2)
+
+
+def get_states(boards: list[SnakeSimulation], out: np.ndarray = None) -> np.ndarray:
+    """
+    Get the states of many boards
+    :param boards: boards to get the states of
+    :param out: preallocated array of shape (len(boards), 11) to write the states into, None to allocate one
+    :return: A numpy array with one board state per row
+    """
+    if out is None:
+        out = np.empty((len(boards), 11), dtype=int)
+    for board, row in zip(boards, out):
+        board.get_state(row)
+    return out
@@ -2,7 +2,8 @@
 Author: Bruce Smith
 Date: August 24, 2023
 """
-import pygame
+from collections import Counter, deque
+from Game import keys
 from Game.cellitem import CellItem
 
 
@@ -13,23 +14,10 @@ class Apple(CellItem):
     pass
 
 
-class Node(CellItem):
-    """
-    Node object that makes up the Snake linked-list
-    """
-    def __init__(self, x: int, y: int) -> None:
-        """
-        Initialize node object
-        :param x: width index of node
-        :param y: height index of node
-        """
-        super().__init__(x, y)
-        self.next = None
-
-
 class Snake:
     """
-    Snake linked-list class comprised of Nodes
+    Snake class, a deque of body coordinates (head first) with a count of
+    segments per cell so length and body lookups take constant time
     """
     def __init__(self, head_x: int, head_y: int) -> None:
         """
@@ -37,12 +25,28 @@ class Snake:
         :param head_x: width index of head
         :param head_y: height index of head
         """
-        self.head = Node(head_x, head_y)
-        self.tail = Node(head_x-1, head_y)
-        self.head.next = self.tail
-        self.prev_dir = pygame.K_RIGHT
+        self.head = CellItem(head_x, head_y)
+        self.body = deque()
+        self.occupancy = Counter()
+        self._push_tail((head_x, head_y))
+        self._push_tail((head_x-1, head_y))
+        self.prev_dir = keys.K_RIGHT
         self.score = 0
 
+    @classmethod
+    def from_cells(cls, cells: list[tuple[int, int]]) -> "Snake":
+        """
+        Create a snake covering the given cells
+        :param cells: cells of the snake from head to tail, at least two
+        :return: The snake, heading right until its prev_dir is set
+        """
+        snake = cls(*cells[0])
+        snake.body.clear()
+        snake.occupancy.clear()
+        for coords in cells:
+            snake._push_tail(coords)
+        return snake
+
     def __len__(self) -> int:
         """
         Get length of snake
@@ -69,71 +73,85 @@ class Snake:
         Get list of coordinates of snake nodes
         :return: List of tuples with coordinates for each node
         """
-        coordinates = []
-        curr_node = self.head
-        while curr_node is not None:
-            coordinates.append(curr_node.get_coordinates())
-            curr_node = curr_node.next
-        return coordinates
+        return list(self.body)
 
     def size(self) -> int:
         """
         Calculate number of nodes in snake
         :return: number of nodes in snake
         """
-        size = 0
-        curr = self.head
-        while curr is not None:
-            size += 1
-            curr = curr.next
-        return size
+        return len(self.body)
+
+    def in_body(self, coords: tuple[int, int]) -> bool:
+        """
+        Check if a cell is covered by the snake's body, not counting the head
+        :param coords: tuple of coordinates (x, y)
+        :return: True if a body node is in the cell, False otherwise
+        """
+        count = self.occupancy[coords]
+        if coords == (self.head.x, self.head.y):
+            count -= 1
+        return count > 0
 
     def move(self, key_cmd: int) -> None:
         """
         Move the snake
-        :param key_cmd: pygame constant int to relay key pressed
+        :param key_cmd: key code (see Game.keys) to relay key pressed
+        :return: None
+        """
+        self._pop_tail()
+        self.extend_and_move(key_cmd)
+
+    def extend_and_move(self, key_cmd: int) -> None:
+        """
+        Extend and move the snake
+        :param key_cmd: key code (see Game.keys) to relay key pressed
         :return: None
         """
-        prev_coord = self.head.get_coordinates()
         # set new head coordinates
-        if key_cmd == pygame.K_UP:
+        if key_cmd == keys.K_UP:
             self._move_up()
-        elif key_cmd == pygame.K_DOWN:
+        elif key_cmd == keys.K_DOWN:
             self._move_down()
-        elif key_cmd == pygame.K_RIGHT:
+        elif key_cmd == keys.K_RIGHT:
             self._move_right()
-        elif key_cmd == pygame.K_LEFT:
+        elif key_cmd == keys.K_LEFT:
             self._move_left()
         else:
             self._move_straight()
 
-        # update body coordinates
-        curr_node = self.head.next
-        while curr_node is not None:
-            curr_coord = curr_node.get_coordinates()
-            curr_node.set_coordinates(prev_coord)
-            prev_coord = curr_coord
-            curr_node = curr_node.next
+        coords = (self.head.x, self.head.y)
+        self.body.appendleft(coords)
+        self.occupancy[coords] += 1
 
-    def extend_and_move(self, key_cmd: int) -> None:
+    def _push_tail(self, coords: tuple[int, int]) -> None:
         """
-        Extend and move the snake
-        :param key_cmd: pygame constant int to relay key pressed
+        Add a node behind the tail
+        :param coords: tuple of coordinates (x, y)
         :return: None
         """
-        new_node = Node(self.tail.x, self.tail.y)
-        self.move(key_cmd)
-        self.tail.next = new_node
-        self.tail = new_node
+        self.body.append(coords)
+        self.occupancy[coords] += 1
+
+    def _pop_tail(self) -> tuple[int, int]:
+        """
+        Remove the tail node
+        :return: coordinates of the removed node
+        """
+        coords = self.body.pop()
+        self.occupancy[coords] -= 1
+        if not self.occupancy[coords]:
+            del self.occupancy[coords]
+        return coords
 
     def _move_up(self) -> None:
         """
         Move snake head up
         :return: None
         """
-        if self.prev_dir != pygame.K_DOWN:
+        if self.prev_dir != keys.K_DOWN:
             self.head.y -= 1
-            self.prev_dir = pygame.K_UP
+            self.prev_dir = keys.K_UP
         else:
             self._move_straight()
 
@@ -142,9 +160,9 @@ class Snake:
         Move snake head down
         :return: None
         """
-        if self.prev_dir != pygame.K_UP:
+        if self.prev_dir != keys.K_UP:
             self.head.y += 1
-            self.prev_dir = pygame.K_DOWN
+            self.prev_dir = keys.K_DOWN
         else:
             self._move_straight()
 
@@ -153,9 +171,9 @@ class Snake:
         Move snake head right
         :return: None
         """
-        if self.prev_dir != pygame.K_LEFT:
+        if self.prev_dir != keys.K_LEFT:
             self.head.x += 1
-            self.prev_dir = pygame.K_RIGHT
+            self.prev_dir = keys.K_RIGHT
         else:
             self._move_straight()
 
@@ -164,9 +182,9 @@ class Snake:
         Move snake head left
         :return: None
         """
-        if self.prev_dir != pygame.K_RIGHT:
+        if self.prev_dir != keys.K_RIGHT:
             self.head.x -= 1
-            self.prev_dir = pygame.K_LEFT
+            self.prev_dir = keys.K_LEFT
         else:
             self._move_straight()
 
@@ -176,11 +194,11 @@ class Snake:
         :return: None
         """
         match self.prev_dir:
-            case pygame.K_UP:
+            case keys.K_UP:
                 self._move_up()
-            case pygame.K_DOWN:
+            case keys.K_DOWN:
                 self._move_down()
-            case pygame.K_RIGHT:
+            case keys.K_RIGHT:
                 self._move_right()
-            case pygame.K_LEFT:
+            case keys.K_LEFT:
                 self._move_left()
@@ -0,0 +1,235 @@
+"""
+Author: Bruce Smith
+Date: August 24, 2023
+"""
+import argparse
+import csv
+import itertools
+import json
+import math
+import multiprocessing as mp
+import os
+import random
+import statistics
+import time
+from Model.metrics import MetricsRecorder
+from Model.snakedqn import DQNConfig
+
+# columns of the results table before the hyperparameters
+RESULT_FIELDS = ("trial", "status", "games", "steps", "seconds", "mean_score", "record")
+
+
+def _sample(spec: object, rng: random.Random) -> object:
+    """
+    Draw one value of a hyperparameter
+    :param spec: list of choices, {"low", "high", "log", "int"} range, or a fixed value
+    :param rng: random number generator
+    :return: The value
+    """
+    if isinstance(spec, list):
+        return rng.choice(spec)
+    if isinstance(spec, dict):
+        low, high = spec["low"], spec["high"]
+        if spec.get("log", False):
+            value = math.exp(rng.uniform(math.log(low), math.log(high)))
+        else:
+            value = rng.uniform(low, high)
+        return round(value) if spec.get("int", False) else value
+    return spec
+
+
+def _check_space(space: dict) -> None:
+    """
+    Check that a search space only names DQNConfig fields
+    :param space: hyperparameter specs by DQNConfig field
+    :return: None
+    """
+    unknown = set(space) - set(DQNConfig._fields)
+    if unknown:
+        raise ValueError("unknown hyperparameters {}, expected some of {}".format(sorted(unknown), DQNConfig._fields))
+
+
+def grid_configs(space: dict, base: DQNConfig = DQNConfig()) -> list[DQNConfig]:
+    """
+    Get every combination of the listed hyperparameter values
+    :param space: list of values (or a fixed value) by DQNConfig field
+    :param base: config the other hyperparameters are taken from
+    :return: One config per combination
+    """
+    _check_space(space)
+    if any(isinstance(spec, dict) for spec in space.values()):
+        raise ValueError("a grid search needs a list of values for every hyperparameter, not a range")
+    names = list(space)
+    values = [spec if isinstance(spec, list) else [spec] for spec in space.values()]
+    return [base._replace(**dict(zip(names, combination))) for combination in itertools.product(*values)]
+
+
+def random_configs(space: dict, n_trials: int, seed: int = None, base: DQNConfig = DQNConfig()) -> list[DQNConfig]:
+    """
+    Draw hyperparameters at random
+    :param space: hyperparameter specs by DQNConfig field, see _sample
+    :param n_trials: number of configs
+    :param seed: seed for drawing the configs, None for a random seed
+    :param base: config the other hyperparameters are taken from
+    :return: n_trials configs
+    """
+    _check_space(space)
+    rng = random.Random(seed)
+    return [base._replace(**{name: _sample(spec, rng) for name, spec in space.items()}) for _ in range(n_trials)]
+
+
+def run_trial(trial: int, config: DQNConfig, n_games: int, max_seconds: float, report_every: int,
+              window: int, min_trials: int, seed: int, max_idle_steps: int, reports: dict) -> dict:
+    """
+    Train a DQN with one config until its budget runs out or it falls behind. Runs in a worker process.
+    Every report_every games the trial reports its rolling mean score and stops early if it is below the
+    median that at least min_trials other trials reported after the same number of games.
+    :param trial: index of the trial
+    :param config: hyperparameters to train with
+    :param n_games: most games to train for
+    :param max_seconds: most seconds to train for, None for no limit
+    :param report_every: games between reports
+    :param window: number of recent games the rolling mean score is taken over
+    :param min_trials: reports from other trials needed before stopping a trial
+    :param seed: seed for the games and the DQN, the same for every trial so they differ only by config
+    :param max_idle_steps: end a game as lost after this many moves without eating, None for twice the board size,
+        0 for no limit
+    :param reports: dict shared between the workers of the rolling mean by (report index, trial)
+    :return: dict of the trial's outcome and config, see RESULT_FIELDS
+    """
+    import torch
+    from Game.runner import TrainingRunner
+    from Model.snakedqn import SnakeDQN
+
+    # the workers already use every core between them
+    torch.set_num_threads(1)
+    dqn = SnakeDQN.from_config(config, seed=seed)
+    dqn.metrics = MetricsRecorder(window=window)
+    runner = TrainingRunner(dqn, log_every=0, seed=seed, max_idle_steps=max_idle_steps)
+
+    start_time = time.perf_counter()
+    status = "done"
+    report = 0
+    while dqn.n_game < n_games:
+        # the budget is checked after every game, not only between reports
+        runner.run(n_games=1)
+        if dqn.n_game % report_every == 0 or dqn.n_game == n_games:
+            report += 1
+            score = dqn.metrics.mean()
+            reports[(report, trial)] = score
+            others = [value for (index, other), value in reports.items() if index == report and other != trial]
+            if dqn.n_game < n_games and len(others) >= min_trials and score < statistics.median(others):
+                status = "stopped"
+                break
+        if dqn.n_game < n_games and max_seconds is not None and time.perf_counter() - start_time > max_seconds:
+            status = "timeout"
+            break
+    return dict({"trial": trial, "status": status, "games": dqn.n_game, "steps": runner.n_steps,
+                 "seconds": round(time.perf_counter() - start_time, 2), "mean_score": dqn.metrics.mean(),
+                 "record": dqn.metrics.best}, **config._asdict())
+
+
+def _run_trial(args: tuple) -> dict:
+    """
+    Unpack the arguments of run_trial for Pool.imap_unordered
+    :param args: arguments of run_trial
+    :return: Result of run_trial
+    """
+    return run_trial(*args)
+
+
+def sweep(configs: list[DQNConfig], n_games: int = 1000, max_seconds: float = None, report_every: int = 50,
+          window: int = 50, min_trials: int = 3, n_workers: int = None, seed: int = 0,
+          max_idle_steps: int = None) -> list[dict]:
+    """
+    Train one DQN per config across a process pool, stopping trials that fall behind early
+    :param configs: hyperparameters of each trial
+    :param n_games: most games per trial
+    :param max_seconds: most seconds per trial, None for no limit
+    :param report_every: games between the reports trials are compared on
+    :param window: number of recent games the rolling mean score is taken over
+    :param min_trials: reports from other trials needed before stopping a trial
+    :param n_workers: number of worker processes, None for one per CPU
+    :param seed: seed for the games and DQNs of every trial
+    :param max_idle_steps: end a game as lost after this many moves without eating, None for twice the board size,
+        0 for no limit
+    :return: Result of each trial as it finished, see run_trial
+    """
+    context = mp.get_context("spawn")
+    with context.Manager() as manager, context.Pool(n_workers or os.cpu_count()) as pool:
+        reports = manager.dict()
+        results = []
+        for result in pool.imap_unordered(_run_trial, [
+                (trial, config, n_games, max_seconds, report_every, window, min_trials, seed, max_idle_steps, reports)
+                for trial, config in enumerate(configs)]):
+            print("Trial {trial}: {status} after {games} games, mean score {mean_score:.2f}, "
+                  "record {record}".format(**result))
+            results.append(result)
+    return results
+
+
+def write_results(path: str, results: list[dict]) -> None:
+    """
+    Write the results of a sweep to a CSV file, best rolling mean score first
+    :param path: path of the CSV file
+    :param results: result of sweep
+    :return: None
+    """
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=RESULT_FIELDS + DQNConfig._fields)
+        writer.writeheader()
+        writer.writerows(sorted(results, key=lambda result: -result["mean_score"]))
+
+
+def print_results(results: list[dict], space: dict) -> None:
+    """
+    Print the results of a sweep as a table, best rolling mean score first
+    :param results: result of sweep
+    :param space: search space, whose hyperparameters get a column
+    :return: None
+    """
+    columns = list(RESULT_FIELDS) + list(space)
+    rows = [[str(round(value, 6) if isinstance(value, float) else value) for value in
+             (result[column] for column in columns)]
+            for result in sorted(results, key=lambda result: -result["mean_score"])]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    for row in [columns] + rows:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search DQN hyperparameters with parallel training runs")
+    parser.add_argument("space", help='JSON file of values by DQNConfig field, e.g. {"lr": [0.0005, 0.001], '
+                                      '"gamma": {"low": 0.9, "high": 0.99}, "hidden_n": [128, 256]}')
+    parser.add_argument("--random", type=int, default=None,
+                        help="draw this many random configs instead of trying every combination")
+    parser.add_argument("--games", type=int, default=1000, help="most games per trial")
+    parser.add_argument("--max-seconds", type=float, default=None, help="most seconds per trial")
+    parser.add_argument("--report-every", type=int, default=50, help="games between comparisons of the trials")
+    parser.add_argument("--window", type=int, default=50, help="games the rolling mean score is taken over")
+    parser.add_argument("--min-trials", type=int, default=3,
+                        help="trials that must reach a comparison before the ones below the median are stopped")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes, default one per CPU")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the games, DQNs and random configs")
+    parser.add_argument("--max-idle-steps", type=int, default=None,
+                        help="end a game as lost after this many moves without eating, "
+                             "default twice the board size, 0 for no limit")
+    parser.add_argument("--output", default="sweep.csv", help="CSV file to write the results table to")
+    parser.add_argument("--best-config", default=None,
+                        help="JSON file to write the best config to, for Game.runner --config")
+    args = parser.parse_args()
+
+    with open(args.space) as file:
+        search_space = json.load(file)
+    if args.random is None:
+        trial_configs = grid_configs(search_space)
+    else:
+        trial_configs = random_configs(search_space, args.random, args.seed)
+    sweep_results = sweep(trial_configs, args.games, args.max_seconds, args.report_every, args.window,
+                          args.min_trials, args.workers, args.seed, args.max_idle_steps)
+    write_results(args.output, sweep_results)
+    print_results(sweep_results, search_space)
+    if args.best_config is not None:
+        best = max(sweep_results, key=lambda result: result["mean_score"])
+        with open(args.best_config, "w") as file:
+            json.dump({field: best[field] for field in DQNConfig._fields}, file, indent=2)
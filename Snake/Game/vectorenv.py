@@ -0,0 +1,213 @@
+"""
+Author: Bruce Smith
+Date: August 24, 2023
+"""
+import numpy as np
+
+
+class VectorSnakeEnv:
+    """
+    Batch of snake games held as NumPy arrays and stepped in lockstep.
+    Follows the rules of SnakeSimulation, with directions stored clockwise
+    (0 = up, 1 = right, 2 = down, 3 = left) and actions as indices (0 = straight, 1 = right, 2 = left).
+    """
+    DELTA_X = np.array([0, 1, 0, -1])
+    DELTA_Y = np.array([-1, 0, 1, 0])
+    TURNS = np.array([0, 1, 3])
+
+    def __init__(self, n_envs: int, n_cols: int = 16, n_rows: int = 14, seed: int = None,
+                 observation: str = "features") -> None:
+        """
+        Initialize the batch of games
+        :param n_envs: number of games to step together
+        :param n_cols: number of cells across each board, including the border cells
+        :param n_rows: number of cells down each board, including the border cells
+        :param seed: seed for apple placement, None for a random seed
+        :param observation: "features" for the 11 get_state features, "grid" for the board planes of self.grid
+        """
+        if observation not in ("features", "grid"):
+            raise ValueError("observation must be 'features' or 'grid'")
+        self.observation = observation
+        self.n_envs = n_envs
+        self.n_cols = n_cols
+        self.n_rows = n_rows
+        self.capacity = n_cols * n_rows
+        self.rng = np.random.default_rng(seed)
+
+        # ring buffer of body coordinates per game, head at head_ptr, tail length-1 entries behind it
+        self.body_x = np.zeros((n_envs, self.capacity), dtype=np.intp)
+        self.body_y = np.zeros((n_envs, self.capacity), dtype=np.intp)
+        self.head_ptr = np.zeros(n_envs, dtype=np.intp)
+        self.length = np.zeros(n_envs, dtype=np.intp)
+        # board planes per game: snake segments per cell, head, apple and neck (the cell behind the head,
+        # giving the direction); the first plane is the occupancy grid collisions are checked against
+        self.grid = np.zeros((n_envs, 4, n_rows, n_cols), dtype=np.uint8)
+        self.occupancy = self.grid[:, 0]
+        self.direction = np.zeros(n_envs, dtype=np.intp)
+        self.apple_x = np.zeros(n_envs, dtype=np.intp)
+        self.apple_y = np.zeros(n_envs, dtype=np.intp)
+        self.score = np.zeros(n_envs, dtype=np.int64)
+
+        # cells a new apple may be placed on
+        self.interior = np.zeros((n_rows, n_cols), dtype=bool)
+        self.interior[1:-1, 1:-1] = True
+        self._env_idx = np.arange(n_envs)
+
+        self.states = np.zeros((n_envs, 11), dtype=int) if observation == "features" else self.grid
+        self.reset()
+
+    def reset(self, mask: np.ndarray = None) -> np.ndarray:
+        """
+        Reset games to the starting position
+        :param mask: boolean array selecting the games to reset, None to reset all of them
+        :return: states of all games
+        """
+        idx = self._env_idx if mask is None else np.flatnonzero(mask)
+        head_x = self.n_cols // 2 - 2
+        head_y = self.n_rows // 2
+
+        self.grid[idx] = 0
+        self.body_x[idx, 0] = head_x - 1
+        self.body_y[idx, 0] = head_y
+        self.body_x[idx, 1] = head_x
+        self.body_y[idx, 1] = head_y
+        self.head_ptr[idx] = 1
+        self.length[idx] = 2
+        self.occupancy[idx, head_y, head_x - 1] = 1
+        self.occupancy[idx, head_y, head_x] = 1
+        self.grid[idx, 1, head_y, head_x] = 1
+        self.grid[idx, 2, head_y, head_x + 3] = 1
+        self.grid[idx, 3, head_y, head_x - 1] = 1
+        self.direction[idx] = 1
+        self.apple_x[idx] = head_x + 3
+        self.apple_y[idx] = head_y
+        self.score[idx] = 0
+
+        if self.observation == "features":
+            self.states[idx] = self.get_state(idx)
+        return self.states
+
+    def head(self, idx: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get head coordinates
+        :param idx: indices of the games, None for all of them
+        :return: Tuple of x and y coordinate arrays
+        """
+        idx = self._env_idx if idx is None else idx
+        ptr = self.head_ptr[idx]
+        return self.body_x[idx, ptr], self.body_y[idx, ptr]
+
+    def step(self, actions: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Advance every game by one move; finished games are reset automatically
+        :param actions: action index per game, or one-hot action rows as returned by SnakeDQN.get_action
+        :return: Tuple of next states, rewards and done flags. self.states holds the states to act on next.
+            For "features" the next states of finished games are their final states. For "grid" the next
+            states are self.grid itself (no copy), valid until the next step, with finished games already reset
+        """
+        actions = np.asarray(actions)
+        if actions.ndim == 2:
+            actions = np.argmax(actions, axis=1)
+        idx = self._env_idx
+        head_x, head_y = self.head()
+        eating = (head_x == self.apple_x) & (head_y == self.apple_y)
+        prev_distance = (head_x - self.apple_x)**2 + (head_y - self.apple_y)**2
+
+        self.direction = (self.direction + self.TURNS[actions]) % 4
+        new_x = head_x + self.DELTA_X[self.direction]
+        new_y = head_y + self.DELTA_Y[self.direction]
+
+        # the old head becomes the neck
+        neck_ptr = (self.head_ptr - 1) % self.capacity
+        self.grid[idx, 3, self.body_y[idx, neck_ptr], self.body_x[idx, neck_ptr]] = 0
+        self.grid[idx, 1, head_y, head_x] = 0
+        self.grid[idx, 3, head_y, head_x] = 1
+        self.grid[idx, 1, new_y, new_x] = 1
+
+        # tail leaves its cell unless the snake is growing
+        moving = ~eating
+        tail_ptr = (self.head_ptr - self.length + 1) % self.capacity
+        self.occupancy[idx[moving], self.body_y[moving, tail_ptr[moving]], self.body_x[moving, tail_ptr[moving]]] -= 1
+        self.length += eating
+
+        self.head_ptr = (self.head_ptr + 1) % self.capacity
+        self.body_x[idx, self.head_ptr] = new_x
+        self.body_y[idx, self.head_ptr] = new_y
+        border_collision = ~((0 < new_x) & (new_x < self.n_cols - 1) &
+                             (0 < new_y) & (new_y < self.n_rows - 1))
+        body_collision = self.occupancy[idx, new_y, new_x] > 0
+        self.occupancy[idx, new_y, new_x] += 1
+
+        board_full = np.zeros(self.n_envs, dtype=bool)
+        if eating.any():
+            eaters = np.flatnonzero(eating)
+            self.score += eating
+            self.grid[eaters, 2, self.apple_y[eaters], self.apple_x[eaters]] = 0
+            board_full[eating] = ~self._place_apples(eaters)
+            self.grid[eaters, 2, self.apple_y[eaters], self.apple_x[eaters]] = 1
+
+        dones = border_collision | body_collision | board_full
+        distance = (new_x - self.apple_x)**2 + (new_y - self.apple_y)**2
+        rewards = np.where(distance < prev_distance, 1, 0)
+        rewards[eating] = 10
+        rewards[border_collision | body_collision] = -10
+
+        if self.observation == "grid":
+            if dones.any():
+                self.reset(dones)
+            return self.grid, rewards, dones
+
+        next_states = self.get_state()
+        self.states[:] = next_states
+        if dones.any():
+            self.reset(dones)
+        return next_states, rewards, dones
+
+    def _place_apples(self, idx: np.ndarray) -> np.ndarray:
+        """
+        Move the apples of the given games to random free cells
+        :param idx: indices of the games needing a new apple
+        :return: boolean array, False where the board has no free cell left
+        """
+        free = (self.occupancy[idx] == 0) & self.interior
+        weights = self.rng.random(free.shape) * free
+        cell = np.argmax(weights.reshape(len(idx), -1), axis=1)
+        self.apple_y[idx], self.apple_x[idx] = np.divmod(cell, self.n_cols)
+        return free.reshape(len(idx), -1).any(axis=1)
+
+    def get_state(self, idx: np.ndarray = None, out: np.ndarray = None) -> np.ndarray:
+        """
+        Get the SnakeSimulation.get_state features of each game
+        :param idx: indices of the games, None for all of them
+        :param out: preallocated array of shape (len(idx), 11) to write the states into, None to allocate one
+        :return: A numpy array of shape (len(idx), 11) describing the board states
+        """
+        idx = self._env_idx if idx is None else idx
+        head_x, head_y = self.head(idx)
+        direction = self.direction[idx]
+        state = np.empty((len(idx), 11), dtype=int) if out is None else out
+
+        # Danger straight, right and left
+        for col, turn in enumerate(self.TURNS):
+            look = (direction + turn) % 4
+            pt_x = head_x + self.DELTA_X[look]
+            pt_y = head_y + self.DELTA_Y[look]
+            border_collision = ~((0 < pt_x) & (pt_x < self.n_cols - 1) &
+                                 (0 < pt_y) & (pt_y < self.n_rows - 1))
+            body_collision = self.occupancy[idx,
+                                            np.clip(pt_y, 0, self.n_rows - 1),
+                                            np.clip(pt_x, 0, self.n_cols - 1)] > 0
+            state[:, col] = border_collision | body_collision
+
+        # Move direction (up, down, left, right)
+        state[:, 3] = direction == 0
+        state[:, 4] = direction == 2
+        state[:, 5] = direction == 3
+        state[:, 6] = direction == 1
+
+        # Food location (left, right, up, down)
+        state[:, 7] = self.apple_x[idx] < head_x
+        state[:, 8] = self.apple_x[idx] > head_x
+        state[:, 9] = self.apple_y[idx] < head_y
+        state[:, 10] = self.apple_y[idx] > head_y
+        return state
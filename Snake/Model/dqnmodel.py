@@ -6,6 +6,7 @@ Sources used:
  - https://www.geeksforgeeks.org/ai-driven-snake-game-using-deep-q-learning/#
  - https://www.diva-portal.org/smash/get/diva2:1342302/FULLTEXT01.pdf
 """
+import copy
 import numpy as np
 import torch
 import torch.nn as nn
@@ -38,51 +39,115 @@ class LinearDQN(nn.Module):
         return x
 
 
+class ConvDQN(nn.Module):
+    def __init__(self, channels: int, n_rows: int, n_cols: int, output_n: int, hidden_n: int = 256) -> None:
+        """
+        Initialize convolutional DQN model for grid states (see SnakeSimulation.get_grid_state)
+        :param channels: number of board planes
+        :param n_rows: number of cells down the board
+        :param n_cols: number of cells across the board
+        :param output_n: size of output
+        :param hidden_n: number of hidden nodes after the convolutions
+        """
+        super().__init__()
+        self.input_shape = (channels, n_rows, n_cols)
+        self.conv1 = nn.Conv2d(channels, 16, kernel_size=3, padding=1)
+        self.conv2 = nn.Conv2d(16, 32, kernel_size=3, stride=2, padding=1)
+        conv_n = 32 * ((n_rows + 1) // 2) * ((n_cols + 1) // 2)
+        self.layer1 = nn.Linear(conv_n, hidden_n)
+        self.layer2 = nn.Linear(hidden_n, output_n)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Given input states, determine predicted action outputted by the model
+        :param x: input states, shaped (batch, channels, n_rows, n_cols) or flattened to (batch, features)
+        :return: output tensor with predicted action to take
+        """
+        x = x.reshape(-1, *self.input_shape)
+        x = F.relu(self.conv1(x))
+        x = F.relu(self.conv2(x))
+        x = F.relu(self.layer1(x.flatten(1)))
+        x = self.layer2(x)
+        return x
+
+
 class QNNTrainer:
-    def __init__(self, model: LinearDQN, lr: float, gamma: float) -> None:
+    def __init__(self, model: nn.Module, lr: float, gamma: float, target_sync: int = 0,
+                 tau: float = None, double: bool = False) -> None:
         """
         Initialize the DQN trainer
         :param model: the model to use
         :param lr: learning rate
         :param gamma: discount rate
+        :param target_sync: copy the model into a frozen target network every N train steps, 0 for no target network
+        :param tau: if given, blend this fraction of the model into the target network every train step instead
+        :param double: True for Double-DQN targets, where the model picks the next action and the target network scores it
         """
         self.lr = lr
         self.model = model
         self.gamma = gamma
         self.optimizer = optim.Adam(model.parameters(), lr=lr)
-        self.criterion = nn.MSELoss()
+        self.criterion = nn.MSELoss(reduction='none')
+        self.target_sync = target_sync
+        self.tau = tau
+        self.double = double
+        self.n_steps = 0
+        if target_sync > 0 or tau is not None:
+            self.target_model = copy.deepcopy(model)
+            self.target_model.requires_grad_(False)
+        else:
+            self.target_model = model
 
-    def train_step(self, transitions: list[Transition]) -> None:
+    def sync_target(self) -> None:
         """
-        Train the DQN
-        :param transitions: a list of Transitions use to train the model
+        Update the target network from the model, by copy or by Polyak averaging if tau is set
         :return: None
         """
-        batch = Transition(*zip(*transitions))
-        state = torch.tensor(batch.state, dtype=torch.float)
-        next_state = torch.tensor(batch.next_state, dtype=torch.float)
-        action = torch.tensor(batch.action, dtype=torch.long)
-        reward = torch.tensor(batch.reward, dtype=torch.float)
-        done = torch.tensor(batch.done, dtype=torch.float)
+        if self.target_model is self.model:
+            return
+        with torch.no_grad():
+            if self.tau is None:
+                self.target_model.load_state_dict(self.model.state_dict())
+            else:
+                for target_param, param in zip(self.target_model.parameters(), self.model.parameters()):
+                    target_param.lerp_(param, self.tau)
 
-        if len(state.shape) == 1:
-            state = torch.unsqueeze(state, 0)
-            next_state = torch.unsqueeze(next_state, 0)
-            action = torch.unsqueeze(action, 0)
-            reward = torch.unsqueeze(reward, 0)
-            done = (done,)
+    def train_step(self, batch: Transition, weights: np.ndarray = None, gamma: float = None) -> np.ndarray:
+        """
+        Train the DQN
+        :param batch: a Transition of batch arrays (see ReplayMemory.get_batch) used to train the model
+        :param weights: importance-sampling weight per transition, None to weigh them equally
+        :param gamma: discount of the next state's value, None for the trainer's gamma
+            (e.g. gamma ** n for n-step transitions)
+        :return: TD error of each transition
+        """
+        state = torch.from_numpy(batch.state)
+        next_state = torch.from_numpy(batch.next_state)
+        action = torch.from_numpy(batch.action)
+        reward = torch.from_numpy(batch.reward)
+        done = torch.from_numpy(batch.done)
 
         pred = self.model(state)
-        target = pred.clone()
-        for idx in range(len(done)):
-            q_new = reward[idx]
-            if not done[idx]:
-                q_new = reward[idx] + self.gamma * torch.max(self.model(next_state[idx]))
-            target[idx][torch.argmax(action).item()] = q_new
-        # 2. Q_new = reward + gamma * max(next_predicted Qvalue)
+        # Q_new = reward + gamma * max(next_predicted Qvalue), only reward for final states
+        with torch.no_grad():
+            if self.double:
+                next_action = self.model(next_state).argmax(dim=1, keepdim=True)
+                next_q = self.target_model(next_state).gather(1, next_action).squeeze(1)
+            else:
+                next_q = self.target_model(next_state).max(dim=1).values
+            q_new = reward + (self.gamma if gamma is None else gamma) * next_q * (1 - done)
+        rows = torch.arange(len(action))
+        target = pred.detach().clone()
+        target[rows, action] = q_new
 
         self.optimizer.zero_grad()
-        loss = self.criterion(target, pred)
-        loss.backward()  # backward propagation of loss
+        loss = self.criterion(target, pred).mean(dim=1)
+        if weights is not None:
+            loss = loss * torch.from_numpy(weights)
+        loss.mean().backward()  # backward propagation of loss
 
         self.optimizer.step()
+        self.n_steps += 1
+        if self.tau is not None or (self.target_sync > 0 and self.n_steps % self.target_sync == 0):
+            self.sync_target()
+        return (q_new - pred.detach()[rows, action]).numpy()
@@ -0,0 +1,204 @@
+"""
+Author: Bruce Smith
+Date: August 24, 2023
+"""
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import queue
+from collections import deque
+
+
+class MetricsRecorder:
+    """
+    Records game scores with O(1) rolling statistics and buffered writes to a CSV or JSONL file.
+    Plotting happens in a separate process (start_live_plot) or offline (plot_file), never on the training loop.
+    """
+    def __init__(self, path: str = None, window: int = 10, flush_every: int = 100) -> None:
+        """
+        Initialize the recorder
+        :param path: CSV file, or JSONL file if it ends in .jsonl, to append results to; None to keep no log
+        :param window: number of recent games in the rolling mean
+        :param flush_every: number of games buffered before writing to the file
+        """
+        self.path = path
+        self.window = window
+        self.flush_every = flush_every
+        self.n_game = 0
+        self.best = 0
+        self.last = 0
+        self.recent = deque(maxlen=window)
+        self.recent_sum = 0
+        self.buffer = []
+        self.plot_queue = None
+
+    def mean(self) -> float:
+        """
+        Get the mean score of the last window games
+        :return: rolling mean score
+        """
+        return self.recent_sum / len(self.recent) if self.recent else 0.0
+
+    def record(self, score: int, **extra) -> None:
+        """
+        Record the score of a finished game
+        :param score: score of the game
+        :param extra: other values to log with the score, e.g. steps or epsilon
+        :return: None
+        """
+        if len(self.recent) == self.window:
+            self.recent_sum -= self.recent[0]
+        self.recent.append(score)
+        self.recent_sum += score
+        self.n_game += 1
+        self.best = max(self.best, score)
+        self.last = score
+
+        row = {"game": self.n_game, "score": score, "mean": self.mean(), **extra}
+        if self.path is not None:
+            self.buffer.append(row)
+            if len(self.buffer) >= self.flush_every:
+                self.flush()
+        if self.plot_queue is not None:
+            try:
+                self.plot_queue.put_nowait((row["game"], row["score"], row["mean"]))
+            except queue.Full:
+                pass
+
+    def flush(self) -> None:
+        """
+        Write buffered results to the file
+        :return: None
+        """
+        if self.path is None or not self.buffer:
+            return
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", newline="") as file:
+            if self.path.endswith(".jsonl"):
+                file.writelines(json.dumps(row) + "\n" for row in self.buffer)
+            else:
+                writer = csv.DictWriter(file, fieldnames=list(self.buffer[0]))
+                if new_file:
+                    writer.writeheader()
+                writer.writerows(self.buffer)
+        self.buffer.clear()
+
+    def start_live_plot(self) -> None:
+        """
+        Start a separate process that graphs results as they are recorded
+        :return: None
+        """
+        if self.plot_queue is not None:
+            return
+        context = mp.get_context("spawn")
+        self.plot_queue = context.Queue(maxsize=10000)
+        context.Process(target=live_plot, args=(self.plot_queue, self.window), daemon=True).start()
+
+    def close(self) -> None:
+        """
+        Flush results and stop the live plot
+        :return: None
+        """
+        self.flush()
+        if self.plot_queue is not None:
+            self.plot_queue.put(None)
+            self.plot_queue = None
+
+    def state_dict(self) -> dict:
+        """
+        Get the values needed to restore the rolling statistics
+        :return: dict of values, see load_state_dict
+        """
+        return {"n_game": self.n_game, "best": self.best, "last": self.last, "recent": list(self.recent)}
+
+    def load_state_dict(self, state: dict) -> None:
+        """
+        Restore the rolling statistics from values returned by state_dict
+        :param state: dict of values
+        :return: None
+        """
+        self.n_game = state["n_game"]
+        self.best = state["best"]
+        self.last = state["last"]
+        self.recent = deque(state["recent"], maxlen=self.window)
+        self.recent_sum = sum(self.recent)
+
+
+def _draw(games: list[int], scores: list[int], means: list[float], window: int) -> None:
+    """
+    Draw the score graph on the current matplotlib figure
+    :param games: game numbers
+    :param scores: score of each game
+    :param means: rolling mean score after each game
+    :param window: number of games in the rolling mean
+    :return: None
+    """
+    import matplotlib.pyplot as plt
+    plt.clf()
+    plt.title('Score vs. number of games')
+    plt.xlabel('Game number (n_game)')
+    plt.ylabel('Score')
+    plt.plot(games, scores, label="Score")
+    plt.plot(games, means, label="{} game average".format(window))
+    plt.legend()
+
+
+def live_plot(updates: mp.Queue, window: int) -> None:
+    """
+    Graph (game, score, mean) tuples from a queue until None arrives. Runs in its own process.
+    :param updates: queue of results from MetricsRecorder.record
+    :param window: number of games in the rolling mean
+    :return: None
+    """
+    import matplotlib.pyplot as plt
+    games, scores, means = [], [], []
+    plt.figure(1)
+    while True:
+        try:
+            item = updates.get(timeout=0.5)
+        except queue.Empty:
+            plt.pause(0.05)
+            continue
+        # take everything that arrived since the last draw
+        items = [item]
+        while items[-1] is not None:
+            try:
+                items.append(updates.get_nowait())
+            except queue.Empty:
+                break
+        for update in items:
+            if update is None:
+                return
+            games.append(update[0])
+            scores.append(update[1])
+            means.append(update[2])
+        _draw(games, scores, means, window)
+        plt.pause(0.001)
+
+
+def plot_file(path: str, window: int = 10) -> None:
+    """
+    Graph results written by a MetricsRecorder
+    :param path: CSV or JSONL file of results
+    :param window: number of games in the rolling mean
+    :return: None
+    """
+    import matplotlib.pyplot as plt
+    with open(path) as file:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in file if line.strip()]
+        else:
+            rows = list(csv.DictReader(file))
+    _draw([int(row["game"]) for row in rows], [float(row["score"]) for row in rows],
+          [float(row["mean"]) for row in rows], window)
+    plt.show()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Graph training results written by MetricsRecorder")
+    parser.add_argument("path", help="CSV or JSONL file of results")
+    parser.add_argument("--window", type=int, default=10, help="number of games in the rolling mean")
+    args = parser.parse_args()
+    plot_file(args.path, args.window)
@@ -0,0 +1,117 @@
+"""
+Author: Bruce Smith
+Date: August 24, 2023
+"""
+import argparse
+import numpy as np
+
+from Model.metrics import MetricsRecorder
+
+# LinearDQN parameters in the order of the forward pass
+LINEAR_DQN_KEYS = ("layer1.weight", "layer1.bias", "layer2.weight", "layer2.bias")
+
+
+def export_policy(state_dict: dict, path: str) -> None:
+    """
+    Save LinearDQN weights to a .npz file that NumpyPolicy loads without torch
+    :param state_dict: state dict of a LinearDQN, e.g. SnakeDQN.model.state_dict()
+    :param path: path of the .npz file
+    :return: None
+    """
+    if set(state_dict) != set(LINEAR_DQN_KEYS):
+        raise ValueError("only LinearDQN weights can be exported, got {}".format(sorted(state_dict)))
+    np.savez(path, **{key: state_dict[key].cpu().numpy().astype(np.float32) for key in LINEAR_DQN_KEYS})
+
+
+class NumpyPolicy:
+    """
+    Forward pass of an exported LinearDQN in NumPy, for playing a trained policy without importing torch.
+    Has the acting part of the SnakeDQN interface, so Game can use it in place of a SnakeDQN;
+    it keeps no replay memory and its training methods do nothing.
+    """
+    def __init__(self, weights: str | dict, epsilon: float = 0.0, seed: int = None) -> None:
+        """
+        Load an exported policy
+        :param weights: .npz file written by export_policy, or a dict of its arrays
+        :param epsilon: probability of a random action, 0 to always act greedily
+        :param seed: seed for random actions, None for a random seed
+        """
+        if isinstance(weights, str):
+            with np.load(weights) as file:
+                weights = {key: file[key] for key in LINEAR_DQN_KEYS}
+        self.w1, self.b1, self.w2, self.b2 = (np.asarray(weights[key], dtype=np.float32) for key in LINEAR_DQN_KEYS)
+        # transposed once so the forward pass is two plain matrix products
+        self.w1 = np.ascontiguousarray(self.w1.T)
+        self.w2 = np.ascontiguousarray(self.w2.T)
+        self.epsilon = epsilon
+        self.rng = np.random.default_rng(seed)
+        self.memory = None
+        self.n_game = 0
+        self.n_train_steps = 0
+        self.metrics = MetricsRecorder()
+
+    def predict(self, states: np.ndarray) -> np.ndarray:
+        """
+        Get the Q-values of a batch of states
+        :param states: The states of the GameBoards, one row per board
+        :return: Array of the Q-value of each action per state
+        """
+        hidden = np.asarray(states, dtype=np.float32) @ self.w1 + self.b1
+        np.maximum(hidden, 0, out=hidden)
+        return hidden @ self.w2 + self.b2
+
+    def get_action(self, state: np.ndarray) -> list[int]:
+        """
+        Get action to perform (straight, right, left)
+        :param state: The state of the GameBoard
+        :return: A list specifying which action to perform
+        """
+        final_move = [0, 0, 0]
+        final_move[self.get_actions(np.asarray(state)[None])[0]] = 1
+        return final_move
+
+    def get_actions(self, states: np.ndarray) -> np.ndarray:
+        """
+        Get greedy actions for a batch of states, random with probability epsilon
+        :param states: The states of the GameBoards, one row per board
+        :return: An array of action indices (0 = straight, 1 = right turn, 2 = left turn)
+        """
+        moves = np.argmax(self.predict(states), axis=1)
+        if self.epsilon > 0:
+            explore = self.rng.random(len(moves)) < self.epsilon
+            moves[explore] = self.rng.integers(0, 3, explore.sum())
+        return moves
+
+    def train_short_memory(self, state: np.ndarray, action: list[int],
+                           next_state: np.ndarray, reward: int, done: bool) -> None:
+        """
+        Does nothing, an exported policy is not trained
+        :return: None
+        """
+
+    def train_long_memory(self, batch_size: int = None) -> None:
+        """
+        Does nothing, an exported policy is not trained
+        :return: None
+        """
+
+    def graph_results(self, score: int, plot: bool = True) -> None:
+        """
+        Store and graph results
+        :param score: The current score
+        :param plot: True to graph the results in a separate process, False to only store them
+        :return: None
+        """
+        self.metrics.record(score)
+        if plot:
+            self.metrics.start_live_plot()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the weights of a SnakeDQN checkpoint for NumpyPolicy")
+    parser.add_argument("checkpoint", help="checkpoint saved by SnakeDQN.save_checkpoint")
+    parser.add_argument("output", help=".npz file to write the policy to")
+    args = parser.parse_args()
+
+    import torch
+    export_policy(torch.load(args.checkpoint)["model"], args.output)
@@ -0,0 +1,156 @@
+"""
+Author: Bruce Smith
+Date: August 24, 2023
+"""
+from abc import ABC, abstractmethod
+import numpy as np
+
+from Model.metrics import MetricsRecorder
+from Model.replaymemory import ReplayMemory, PrioritizedReplayMemory, Transition
+
+
+class QAgent(ABC):
+    """
+    What SnakeDQN and TabularQAgent share: the epsilon-greedy schedule, the replay memory and
+    training on samples of it, and the score metrics. Subclasses pick the greedy actions
+    (greedy_actions) and learn from a batch of transitions (train_batch).
+    """
+    def __init__(self, gamma: float, prioritized: bool = False, memory: ReplayMemory = None,
+                 metrics_path: str = None, seed: int = None, state_n: int = 11, memory_capacity: int = 10000,
+                 batch_size: int = 20, delta_epsilon: float = 1e-4, min_epsilon: float = 0.0001,
+                 n_step: int = 1) -> None:
+        """
+        Initialize the agent
+        :param gamma: discount rate
+        :param prioritized: True to sample replay memory by TD error instead of uniformly
+        :param memory: replay memory to use, e.g. a MemmapReplayMemory, None for a new in-memory one
+        :param metrics_path: CSV or JSONL file to log game results to, None to keep no log
+        :param seed: seed for exploration and the replay memory it creates, None for random
+        :param state_n: number of (binary) features in a state
+        :param memory_capacity: number of transitions the replay memory it creates holds
+        :param batch_size: number of transitions per train_long_memory sample
+        :param delta_epsilon: decrease of the exploration rate per action
+        :param min_epsilon: lowest exploration rate
+        :param n_step: number of moves whose rewards are summed into each replayed transition (see NStepBuffer)
+        """
+        if memory is None:
+            memory_seed = None if seed is None else seed + 1
+            memory = (PrioritizedReplayMemory(memory_capacity, state_n, seed=memory_seed) if prioritized
+                      else ReplayMemory(memory_capacity, state_n, seed=memory_seed))
+        self.memory = memory
+        self.prioritized = isinstance(memory, PrioritizedReplayMemory)
+        self.gamma = gamma
+        self.n_step = n_step
+        # replayed transitions bootstrap from n moves ahead
+        self.replay_gamma = gamma ** n_step
+        self.batch_size = batch_size
+        self.epsilon = 1
+        self.delta_epsilon = delta_epsilon
+        self.min_epsilon = min_epsilon
+        self.n_game = 0
+        self.metrics = MetricsRecorder(metrics_path)
+        self.rng = np.random.default_rng(seed)
+
+    @abstractmethod
+    def greedy_actions(self, states: np.ndarray) -> np.ndarray:
+        """
+        Get the action with the highest value for each state
+        :param states: The states of the GameBoards, one per board
+        :return: An array of action indices
+        """
+
+    @abstractmethod
+    def train_batch(self, batch: Transition, weights: np.ndarray = None, gamma: float = None) -> np.ndarray:
+        """
+        Learn from a batch of transitions
+        :param batch: a Transition of batch arrays (see ReplayMemory.get_batch)
+        :param weights: importance-sampling weight per transition, None to weigh them equally
+        :param gamma: discount of the next state's value, None for the agent's gamma
+        :return: TD error of each transition
+        """
+
+    def get_action(self, state: np.ndarray) -> list[int]:
+        """
+        Get action to perform (straight, right, left)
+        :param state: The state of the GameBoard
+        :return: A list specifying which action to perform
+        """
+        # [1,0,0] = straight, [0,1,0] = right turn, [0,0,1] = left turn
+        final_move = [0, 0, 0]
+        final_move[self.get_actions(np.asarray(state)[None])[0]] = 1
+        return final_move
+
+    def get_actions(self, states: np.ndarray) -> np.ndarray:
+        """
+        Get epsilon-greedy actions for a batch of states, decaying epsilon once per state
+        :param states: The states of the GameBoards, one per board
+        :return: An array of action indices (0 = straight, 1 = right turn, 2 = left turn)
+        """
+        n = len(states)
+        epsilons = np.maximum(self.epsilon - self.delta_epsilon * np.arange(1, n + 1), self.min_epsilon)
+        self.epsilon = epsilons[-1]
+        # get random moves (exploration)
+        explore = epsilons > self.rng.random(n)
+        moves = self.rng.integers(0, 3, n)
+        exploit = np.flatnonzero(~explore)
+        if len(exploit):
+            # get predicted moves (exploitation)
+            moves[exploit] = self.greedy_actions(states[exploit])
+        return moves
+
+    def train_short_memory(self, state: np.ndarray, action: list[int],
+                           next_state: np.ndarray, reward: int, done: bool) -> None:
+        """
+        Train with a single game step
+        :param state: Current state of board
+        :param action: Action performed
+        :param next_state: Next state of board
+        :param reward: Reward earned
+        :param done: True if game ended, False otherwise
+        :return: None
+        """
+        self.train_batch(Transition(np.asarray(state, dtype=np.float32)[None],
+                                    np.array([np.argmax(action)]),
+                                    np.asarray(next_state, dtype=np.float32)[None],
+                                    np.array([reward], dtype=np.float32),
+                                    np.array([done], dtype=np.float32)))
+
+    def train_long_memory(self, batch_size: int = None) -> None:
+        """
+        Train using a random sample from replay memory
+        :param batch_size: size of sample, None for the batch_size the agent was created with
+        :return: None
+        """
+        batch_size = min(batch_size or self.batch_size, len(self.memory))
+        if self.prioritized:
+            sample, idx, weights = self.memory.sample_prioritized(batch_size)
+            self.memory.update_priorities(idx, self.train_batch(sample, weights, self.replay_gamma))
+        else:
+            self.train_batch(self.memory.sample(batch_size), gamma=self.replay_gamma)
+
+    def rng_state_dict(self) -> dict:
+        """
+        Get the states of the exploration and replay sampling random number generators
+        :return: dict of generator states, see load_rng_state_dict
+        """
+        return {"agent": self.rng.bit_generator.state, "memory": self.memory.rng.bit_generator.state}
+
+    def load_rng_state_dict(self, state: dict) -> None:
+        """
+        Restore the random number generators, so a resumed run draws what an uninterrupted one would
+        :param state: dict of generator states from rng_state_dict
+        :return: None
+        """
+        self.rng.bit_generator.state = state["agent"]
+        self.memory.rng.bit_generator.state = state["memory"]
+
+    def graph_results(self, score: int, plot: bool = True) -> None:
+        """
+        Store and graph results of training
+        :param score: The current score
+        :param plot: True to graph the results in a separate process, False to only store them
+        :return: None
+        """
+        self.metrics.record(score)
+        if plot:
+            self.metrics.start_live_plot()
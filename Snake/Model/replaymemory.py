@@ -7,46 +7,485 @@ Sources used:
  - https://www.diva-portal.org/smash/get/diva2:1342302/FULLTEXT01.pdf
 """
 from collections import namedtuple, deque
-import random
+import os
 import numpy as np
 
 Transition = namedtuple('Transition', ('state', 'action', 'next_state', 'reward', 'done'))
 
 
+def record_dtype(state_n: int) -> np.dtype:
+    """
+    Get the fixed-size record layout of a stored transition
+    :param state_n: number of (binary) features in a state
+    :return: NumPy structured dtype with bit-packed states
+    """
+    return np.dtype([('state', np.uint8, ((state_n + 7) // 8,)),
+                     ('action', np.int8),
+                     ('next_state', np.uint8, ((state_n + 7) // 8,)),
+                     ('reward', np.float32),
+                     ('done', np.bool_)])
+
+
 class ReplayMemory:
     """
-    Replay memory class to help train DQN
+    Replay memory class to help train DQN.
+    Transitions are kept in a preallocated ring of fixed-size records, with binary
+    states packed into bits and actions stored as indices.
     """
-    def __init__(self, capacity: int) -> None:
+    def __init__(self, capacity: int, state_n: int = 11, seed: int = None) -> None:
         """
         Initialize replay memory
         :param capacity: number of transitions to hold
+        :param state_n: number of (binary) features in a state
+        :param seed: seed for sampling, None for a random seed
         """
-        self.memory = deque([], maxlen=capacity)
+        self.capacity = capacity
+        self.state_n = state_n
+        self.dtype = record_dtype(state_n)
+        self.records = np.zeros(capacity, dtype=self.dtype)
+        self.position = 0
+        self.size = 0
+        self.rng = np.random.default_rng(seed)
 
     def __len__(self) -> int:
         """
         Get number of transitions in memory
         :return: Number of transitions
         """
-        return len(self.memory)
+        return self.size
 
     def push(self, state: np.ndarray, action: list[int], next_state: np.ndarray, reward: int, done: bool) -> None:
         """
         Save a transition
         :param state: current state
-        :param action: action taken
+        :param action: action taken, as a one-hot list or an index
         :param next_state: next state
         :param reward: reward earned
         :param done: done flag
         :return: None
         """
-        self.memory.append(Transition(state, action, next_state, reward, done))
+        record = self.records[self.position]
+        record['state'] = np.packbits(np.asarray(state, dtype=np.uint8))
+        record['action'] = np.argmax(action) if np.ndim(action) else action
+        record['next_state'] = np.packbits(np.asarray(next_state, dtype=np.uint8))
+        record['reward'] = reward
+        record['done'] = done
+        self.position = (self.position + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
 
-    def sample(self, batch_size: int) -> list[Transition]:
+    def push_batch(self, states: np.ndarray, actions: np.ndarray, next_states: np.ndarray,
+                   rewards: np.ndarray, dones: np.ndarray) -> None:
+        """
+        Save a batch of transitions
+        :param states: current states, one per transition (grid states are flattened)
+        :param actions: action indices taken
+        :param next_states: next states, one per transition
+        :param rewards: rewards earned
+        :param dones: done flags
+        :return: None
+        """
+        n = len(actions)
+        idx = (self.position + np.arange(n)) % self.capacity
+        self.records['state'][idx] = np.packbits(np.asarray(states, dtype=np.uint8).reshape(n, -1), axis=1)
+        self.records['action'][idx] = actions
+        self.records['next_state'][idx] = np.packbits(np.asarray(next_states, dtype=np.uint8).reshape(n, -1), axis=1)
+        self.records['reward'][idx] = rewards
+        self.records['done'][idx] = dones
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def push_records(self, records: np.ndarray) -> None:
+        """
+        Save transitions already packed into records, e.g. copied out of another memory
+        :param records: array of records with this memory's dtype
+        :return: None
+        """
+        n = len(records)
+        self.records[(self.position + np.arange(n)) % self.capacity] = records
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def sample(self, batch_size: int) -> Transition:
         """
         Get a random transition sample of size batch_size
         :param batch_size: size of sample
-        :return: List of a transitions
+        :return: A Transition of batch arrays ready to be converted to tensors
+        """
+        idx = self.rng.choice(self.size, batch_size, replace=False)
+        return self.get_batch(idx)
+
+    def get_batch(self, idx: np.ndarray) -> Transition:
+        """
+        Get the transitions at the given positions
+        :param idx: positions of the transitions in memory
+        :return: A Transition of float32 states, int64 actions, float32 rewards and done flags
+        """
+        records = self.records[idx]
+        return Transition(np.unpackbits(records['state'], axis=1, count=self.state_n).astype(np.float32),
+                          records['action'].astype(np.int64),
+                          np.unpackbits(records['next_state'], axis=1, count=self.state_n).astype(np.float32),
+                          records['reward'].astype(np.float32),
+                          records['done'].astype(np.float32))
+
+    def state_dict(self) -> dict[str, np.ndarray]:
+        """
+        Get the arrays needed to restore this memory
+        :return: dict of arrays, see load_state_dict
+        """
+        return {"records": self.records, "position": np.array(self.position), "size": np.array(self.size)}
+
+    def load_state_dict(self, state: dict[str, np.ndarray]) -> None:
+        """
+        Restore the memory from arrays returned by state_dict
+        :param state: dict of arrays
+        :return: None
+        """
+        if state["records"].shape != self.records.shape or state["records"].dtype != self.dtype:
+            raise ValueError("Saved replay memory does not match this memory's capacity and state size")
+        self.records[:] = state["records"]
+        self.position = int(state["position"])
+        self.size = int(state["size"])
+
+    def save(self, path: str) -> None:
+        """
+        Write the memory to an .npz file, replacing it atomically
+        :param path: path of the file
+        :return: None
+        """
+        with open(path + ".tmp", "wb") as file:
+            np.savez(file, **self.state_dict())
+        os.replace(path + ".tmp", path)
+
+    def load(self, path: str) -> None:
+        """
+        Read the memory from an .npz file written by save
+        :param path: path of the file
+        :return: None
+        """
+        with np.load(path) as data:
+            self.load_state_dict(dict(data))
+
+
+class SumTree:
+    """
+    Binary tree where each parent holds the sum of its children, used to sample
+    leaves in proportion to their priority in O(log n)
+    """
+    def __init__(self, capacity: int) -> None:
+        """
+        Initialize the sum tree with all priorities at zero
+        :param capacity: number of leaves
+        """
+        self.depth = max(int(np.ceil(np.log2(capacity))), 1)
+        self.n_leaves = 2**self.depth
+        # 1-indexed heap layout: root at 1, children of i at 2i and 2i+1, leaves from n_leaves
+        self.tree = np.zeros(2 * self.n_leaves)
+
+    def total(self) -> float:
+        """
+        Get the sum of all priorities
+        :return: sum of priorities
+        """
+        return self.tree[1]
+
+    def get(self, idx: np.ndarray) -> np.ndarray:
+        """
+        Get the priorities of leaves
+        :param idx: leaf indices
+        :return: priorities of the leaves
+        """
+        return self.tree[idx + self.n_leaves]
+
+    def update(self, idx: np.ndarray, priorities: np.ndarray) -> None:
+        """
+        Set the priorities of leaves and update their ancestors' sums
+        :param idx: leaf indices
+        :param priorities: new priorities
+        :return: None
+        """
+        nodes = np.asarray(idx) + self.n_leaves
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values: np.ndarray) -> np.ndarray:
+        """
+        Find the leaves where the running sum of priorities reaches each value
+        :param values: values between 0 and total()
+        :return: leaf indices
+        """
+        values = np.array(values, dtype=float)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            go_right = values >= self.tree[left]
+            values -= np.where(go_right, self.tree[left], 0)
+            nodes = left + go_right
+        return nodes - self.n_leaves
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+    """
+    Replay memory that samples transitions in proportion to their TD error,
+    using a SumTree for O(log n) sampling and priority updates
+    """
+    def __init__(self, capacity: int, state_n: int = 11, alpha: float = 0.6,
+                 beta: float = 0.4, beta_increment: float = 1e-4, min_priority: float = 1e-3,
+                 seed: int = None) -> None:
+        """
+        Initialize prioritized replay memory
+        :param capacity: number of transitions to hold
+        :param state_n: number of (binary) features in a state
+        :param alpha: how strongly priorities shape sampling, 0 for uniform
+        :param beta: initial importance-sampling correction, annealed to 1
+        :param beta_increment: increase of beta per sample
+        :param min_priority: added to every TD error so every transition can still be sampled
+        :param seed: seed for sampling, None for a random seed
+        """
+        super().__init__(capacity, state_n, seed)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.min_priority = min_priority
+        self.max_priority = 1.0
+        self.tree = SumTree(capacity)
+
+    def push(self, state: np.ndarray, action: list[int], next_state: np.ndarray, reward: int, done: bool) -> None:
+        """
+        Save a transition with the highest priority seen so far
+        :param state: current state
+        :param action: action taken, as a one-hot list or an index
+        :param next_state: next state
+        :param reward: reward earned
+        :param done: done flag
+        :return: None
+        """
+        self.tree.update(np.array([self.position]), self.max_priority)
+        super().push(state, action, next_state, reward, done)
+
+    def push_batch(self, states: np.ndarray, actions: np.ndarray, next_states: np.ndarray,
+                   rewards: np.ndarray, dones: np.ndarray) -> None:
+        """
+        Save a batch of transitions with the highest priority seen so far
+        :param states: current states, one row per transition
+        :param actions: action indices taken
+        :param next_states: next states, one row per transition
+        :param rewards: rewards earned
+        :param dones: done flags
+        :return: None
+        """
+        self.tree.update((self.position + np.arange(len(actions))) % self.capacity, self.max_priority)
+        super().push_batch(states, actions, next_states, rewards, dones)
+
+    def push_records(self, records: np.ndarray) -> None:
+        """
+        Save packed records with the highest priority seen so far
+        :param records: array of records with this memory's dtype
+        :return: None
+        """
+        self.tree.update((self.position + np.arange(len(records))) % self.capacity, self.max_priority)
+        super().push_records(records)
+
+    def sample_prioritized(self, batch_size: int) -> tuple[Transition, np.ndarray, np.ndarray]:
+        """
+        Get a transition sample of size batch_size, drawn in proportion to priority
+        :param batch_size: size of sample
+        :return: Tuple of the Transition batch, the positions sampled and their importance-sampling weights
+        """
+        # one draw from each of batch_size equal slices of the total priority
+        segment = self.tree.total() / batch_size
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        idx = np.minimum(self.tree.find(values), self.size - 1)
+
+        probabilities = self.tree.get(idx) / self.tree.total()
+        weights = (self.size * probabilities) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(self.beta + self.beta_increment, 1.0)
+        return self.get_batch(idx), idx, weights.astype(np.float32)
+
+    def state_dict(self) -> dict[str, np.ndarray]:
+        """
+        Get the arrays needed to restore this memory, including priorities
+        :return: dict of arrays, see load_state_dict
+        """
+        return {**super().state_dict(), "tree": self.tree.tree,
+                "max_priority": np.array(self.max_priority), "beta": np.array(self.beta)}
+
+    def load_state_dict(self, state: dict[str, np.ndarray]) -> None:
+        """
+        Restore the memory from arrays returned by state_dict
+        :param state: dict of arrays
+        :return: None
+        """
+        super().load_state_dict(state)
+        self.tree.tree[:] = state["tree"]
+        self.max_priority = float(state["max_priority"])
+        self.beta = float(state["beta"])
+
+    def update_priorities(self, idx: np.ndarray, td_errors: np.ndarray) -> None:
+        """
+        Set the priorities of sampled transitions from their TD errors
+        :param idx: positions of the transitions in memory
+        :param td_errors: TD errors computed when training on the transitions
+        :return: None
+        """
+        priorities = (np.abs(td_errors) + self.min_priority) ** self.alpha
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(idx, priorities)
+
+
+class MemmapReplayMemory(ReplayMemory):
+    """
+    Replay memory kept in a memory-mapped file, so it can exceed RAM, survive restarts
+    and be read by several processes at once. The file holds a small header (capacity, state size,
+    ring position, number of transitions, n_step of the transitions) followed by the records.
+    """
+    HEADER_BYTES = 64
+
+    def __init__(self, path: str, capacity: int = 10000, state_n: int = 11, readonly: bool = False,
+                 seed: int = None, n_step: int = None) -> None:
+        """
+        Open the replay file at path, creating it if it does not exist
+        :param path: path of the replay file
+        :param capacity: number of transitions to hold, ignored when opening an existing file
+        :param state_n: number of (binary) features in a state, ignored when opening an existing file
+        :param readonly: True to map the file read-only, e.g. for extra learner processes
+        :param seed: seed for sampling, None for a random seed
+        :param n_step: number of moves summed into each transition (see NStepBuffer), which an existing
+            file must have been filled with; None to accept the file's, or 1 for a new file
+        """
+        exists = os.path.exists(path)
+        if readonly and not exists:
+            raise FileNotFoundError(path)
+        if not exists:
+            with open(path, "wb") as file:
+                file.truncate(self.HEADER_BYTES + capacity * record_dtype(state_n).itemsize)
+        mode = "r" if readonly else "r+"
+        self.path = path
+        self.header = np.memmap(path, dtype=np.int64, mode=mode, shape=(self.HEADER_BYTES // 8,))
+        if not exists:
+            self.header[:5] = (capacity, state_n, 0, 0, n_step or 1)
+        self.capacity = int(self.header[0])
+        self.state_n = int(self.header[1])
+        self.n_step = int(self.header[4])
+        if n_step is not None and n_step != self.n_step:
+            raise ValueError("{} holds {}-step transitions, not {}-step ones".format(path, self.n_step, n_step))
+        self.dtype = record_dtype(self.state_n)
+        self.records = np.memmap(path, dtype=self.dtype, mode=mode,
+                                 offset=self.HEADER_BYTES, shape=(self.capacity,))
+        self.rng = np.random.default_rng(seed)
+
+    @property
+    def position(self) -> int:
+        """
+        Get the ring position the next transition is written to
+        :return: ring position
+        """
+        return int(self.header[2])
+
+    @position.setter
+    def position(self, position: int) -> None:
+        """
+        Set the ring position the next transition is written to
+        :param position: ring position
+        :return: None
+        """
+        self.header[2] = position
+
+    @property
+    def size(self) -> int:
+        """
+        Get number of transitions in the file, re-read on every call so readers see new writes
+        :return: Number of transitions
+        """
+        return int(self.header[3])
+
+    @size.setter
+    def size(self, size: int) -> None:
+        """
+        Set number of transitions in the file
+        :param size: Number of transitions
+        :return: None
+        """
+        self.header[3] = size
+
+    def flush(self) -> None:
+        """
+        Write pending changes to disk
+        :return: None
+        """
+        self.records.flush()
+        self.header.flush()
+
+    def save(self, path: str) -> None:
+        """
+        Flush the memory to its own file; it is already persistent, so nothing is written to path
+        :param path: unused
+        :return: None
+        """
+        self.flush()
+
+    def load(self, path: str) -> None:
+        """
+        Nothing to load, the memory is read from its own file when opened
+        :param path: unused
+        :return: None
+        """
+        pass
+
+
+class NStepBuffer:
+    """
+    Aggregates the transitions of a game into n-step transitions on their way into a replay memory:
+    (state, action, discounted sum of the next n rewards, state n moves later, done). The transitions
+    left when a game ends are pushed with the rewards that remain, so a stored transition is either
+    done or bootstraps from exactly n moves ahead, with discount gamma ** n.
+    """
+    def __init__(self, memory: ReplayMemory, n_step: int, gamma: float) -> None:
+        """
+        Initialize the buffer
+        :param memory: replay memory to push the n-step transitions to
+        :param n_step: number of moves whose rewards are summed
+        :param gamma: discount rate
+        """
+        self.memory = memory
+        self.n_step = n_step
+        self.discounts = gamma ** np.arange(n_step)
+        self.pending = deque()
+
+    def push(self, state: np.ndarray, action: list[int], next_state: np.ndarray, reward: int, done: bool) -> None:
+        """
+        Add a one-step transition, pushing the n-step transitions it completes to the memory
+        :param state: current state
+        :param action: action taken, as a one-hot list or an index
+        :param next_state: next state
+        :param reward: reward earned
+        :param done: done flag
+        :return: None
+        """
+        # copied, as Game reuses its state buffers
+        self.pending.append((np.array(state), action, reward))
+        if done:
+            while self.pending:
+                self._push_oldest(next_state, True)
+        elif len(self.pending) == self.n_step:
+            self._push_oldest(next_state, False)
+
+    def _push_oldest(self, next_state: np.ndarray, done: bool) -> None:
+        """
+        Push the oldest pending transition with the discounted rewards of the pending moves
+        :param next_state: state after the newest pending move
+        :param done: done flag of the newest pending move
+        :return: None
+        """
+        rewards = [reward for _, _, reward in self.pending]
+        state, action, _ = self.pending.popleft()
+        self.memory.push(state, action, next_state, float(self.discounts[:len(rewards)] @ rewards), done)
+
+    def clear(self) -> None:
+        """
+        Drop the pending transitions, e.g. of a game that was abandoned
+        :return: None
         """
-        return random.sample(self.memory, batch_size)
+        self.pending.clear()
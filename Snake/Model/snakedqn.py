@@ -6,98 +6,176 @@ Sources used:
  - https://www.geeksforgeeks.org/ai-driven-snake-game-using-deep-q-learning/#
  - https://www.diva-portal.org/smash/get/diva2:1342302/FULLTEXT01.pdf
 """
-import random
+from collections import namedtuple
+import os
 import numpy as np
-import torch
-import matplotlib.pyplot as plt
 
+from Model.numpypolicy import export_policy
+from Model.qagent import QAgent
 from Model.replaymemory import ReplayMemory, Transition
-from Model.dqnmodel import QNNTrainer, LinearDQN
 
+# hyperparameters of a SnakeDQN (see SnakeDQN.__init__), with the defaults used so far
+DQNConfig = namedtuple('DQNConfig', ('lr', 'gamma', 'hidden_n', 'memory_capacity', 'batch_size', 'delta_epsilon',
+                                     'min_epsilon', 'prioritized', 'target_sync', 'tau', 'double', 'n_step'),
+                       defaults=(0.001, 0.97, 256, 10000, 20, 1e-4, 0.0001, False, 0, None, False, 1))
 
-class SnakeDQN:
 
-    def __init__(self, lr: float, gamma: float):
+class SnakeDQN(QAgent):
+
+    def __init__(self, lr: float, gamma: float, prioritized: bool = False, memory: ReplayMemory = None,
+                 verbose: bool = False, target_sync: int = 0, tau: float = None, double: bool = False,
+                 metrics_path: str = None, grid_size: tuple[int, int] = None, seed: int = None,
+                 hidden_n: int = 256, memory_capacity: int = 10000, batch_size: int = 20,
+                 delta_epsilon: float = 1e-4, min_epsilon: float = 0.0001, n_step: int = 1):
         """
         Initialize the Snake DQN
         :param lr: learning rate
         :param gamma: discount rate
+        :param prioritized: True to sample replay memory by TD error instead of uniformly
+        :param memory: replay memory to use, e.g. a MemmapReplayMemory, None for a new in-memory one
+        :param verbose: True to print the model's predictions when it picks an action
+        :param target_sync: train steps between hard target network updates, 0 for no target network
+        :param tau: Polyak averaging rate for a soft-updated target network, None for hard updates
+        :param double: True for Double-DQN targets
+        :param metrics_path: CSV or JSONL file to log game results to, None to keep no log
+        :param grid_size: (n_rows, n_cols) to learn from grid states with a ConvDQN, None for the 11 state features
+        :param seed: seed for weight initialization, exploration and the replay memory it creates, None for random
+        :param hidden_n: number of hidden nodes of the model
+        :param memory_capacity: number of transitions the replay memory it creates holds
+        :param batch_size: number of transitions per train_long_memory sample
+        :param delta_epsilon: decrease of the exploration rate per action
+        :param min_epsilon: lowest exploration rate
+        :param n_step: number of moves whose rewards are summed into each replayed transition (see NStepBuffer)
         """
-        self.memory = ReplayMemory(10000)
-        self.model = LinearDQN(11, 256, 3)
-        self.trainer = QNNTrainer(self.model, lr, gamma)
-        self.epsilon = 1
-        self.delta_epsilon = 1e-4
-        self.n_game = 0
-        self.scores = []
-        self.score_means = []
-
-    def get_action(self, state: np.ndarray) -> list[int]:
-        """
-        Get action to perform (straight, right, left)
-        :param state: The state of the GameBoard
-        :return: A list specifying which action to perform
-        """
-        self.epsilon = max(self.epsilon - self.delta_epsilon, 0.0001)
-        # [1,0,0] = straight, [0,1,0] = right turn, [0,0,1] = left turn
-        final_move = [0, 0, 0]
-        if self.epsilon > random.random():
-            # get random move (exploration)
-            move = random.randint(0, 2)
-            final_move[move] = 1
+        # torch is imported on first use, so importing this module (e.g. through Game) stays cheap
+        import torch
+        from Model.dqnmodel import QNNTrainer, LinearDQN, ConvDQN
+        if seed is not None:
+            torch.manual_seed(seed)
+        self.grid_size = grid_size
+        if grid_size is None:
+            state_n = 11
+            self.model = LinearDQN(state_n, hidden_n, 3)
         else:
-            # get DQN predicted move (exploitation)
-            state0 = torch.tensor(state, dtype=torch.float)
+            state_n = 4 * grid_size[0] * grid_size[1]
+            self.model = ConvDQN(4, grid_size[0], grid_size[1], 3, hidden_n)
+        super().__init__(gamma, prioritized, memory, metrics_path, seed, state_n, memory_capacity, batch_size,
+                         delta_epsilon, min_epsilon, n_step)
+        self.trainer = QNNTrainer(self.model, lr, gamma, target_sync, tau, double)
+        self.config = DQNConfig(lr, gamma, hidden_n, memory_capacity, batch_size, delta_epsilon, min_epsilon,
+                                self.prioritized, target_sync, tau, double, n_step)
+        self.verbose = verbose
+        # input buffer reused by greedy_actions, grown when a larger batch arrives
+        self._input = torch.zeros((1, state_n))
+
+    @classmethod
+    def from_config(cls, config: DQNConfig, **kwargs) -> "SnakeDQN":
+        """
+        Create a Snake DQN with the hyperparameters of a config
+        :param config: hyperparameters
+        :param kwargs: other arguments of SnakeDQN.__init__, e.g. memory or seed
+        :return: The Snake DQN
+        """
+        return cls(**config._asdict(), **kwargs)
+
+    @staticmethod
+    def checkpoint_config(path: str) -> DQNConfig | None:
+        """
+        Get the hyperparameters a checkpoint was saved with, to rebuild its model before loading it
+        :param path: path of the checkpoint file
+        :return: The config, None for checkpoints saved without one
+        """
+        import torch
+        config = torch.load(path).get("config")
+        return None if config is None else DQNConfig(**config)
+
+    @property
+    def n_train_steps(self) -> int:
+        """
+        Get number of gradient updates made so far
+        :return: number of train steps
+        """
+        return self.trainer.n_steps
+
+    def greedy_actions(self, states: np.ndarray) -> np.ndarray:
+        """
+        Get the action the model predicts the highest Q-value for, for each state
+        :param states: The states of the GameBoards, one per board
+        :return: An array of action indices
+        """
+        import torch
+        n = len(states)
+        if n > len(self._input):
+            self._input = torch.zeros((n, self._input.shape[1]))
+        state0 = self._input[:n]
+        state0.copy_(torch.from_numpy(states.reshape(n, -1)))
+        with torch.inference_mode():
             prediction = self.model(state0)
+        if self.verbose:
             print("Prediction= ", prediction)
-            move = torch.argmax(prediction).item()
-            final_move[move] = 1
-        return final_move
+        return torch.argmax(prediction, dim=1).numpy()
 
-    def train_short_memory(self, state: np.ndarray, action: list[int],
-                           next_state: np.ndarray, reward: int, done: bool) -> None:
-        """
-        Train the DQN with a single game step
-        :param state: Current state of board
-        :param action: Action performed
-        :param next_state: Next state of board
-        :param reward: Reward earned
-        :param done: True if game ended, False otherwise
-        :return: None
+    def train_batch(self, batch: Transition, weights: np.ndarray = None, gamma: float = None) -> np.ndarray:
         """
-        self.trainer.train_step([Transition(state, action, next_state, reward, done)])
+        Train the DQN with one gradient update on a batch of transitions
+        :param batch: a Transition of batch arrays (see ReplayMemory.get_batch)
+        :param weights: importance-sampling weight per transition, None to weigh them equally
+        :param gamma: discount of the next state's value, None for the DQN's gamma
+        :return: TD error of each transition
+        """
+        return self.trainer.train_step(batch, weights, gamma)
 
-    def train_long_memory(self) -> None:
+    def save_checkpoint(self, path: str, include_memory: bool = False) -> None:
         """
-        Train the DQN using a random sample from replay memory
+        Atomically save the training state (config, weights, optimizer, epsilon, game count, score statistics
+        and random number generators)
+        :param path: path of the checkpoint file
+        :param include_memory: True to also save the replay memory to path + ".memory.npz"
         :return: None
         """
-        batch_size = 20
-        if len(self.memory) < batch_size:
-            sample = self.memory.sample(len(self.memory))
-        else:
-            sample = self.memory.sample(batch_size)
-        self.trainer.train_step(sample)
+        import torch
+        if include_memory:
+            self.memory.save(path + ".memory.npz")
+        self.metrics.flush()
+        checkpoint = {"config": self.config._asdict(),
+                      "model": self.model.state_dict(),
+                      "target_model": self.trainer.target_model.state_dict(),
+                      "optimizer": self.trainer.optimizer.state_dict(),
+                      "train_steps": self.trainer.n_steps,
+                      "epsilon": float(self.epsilon),
+                      "n_game": self.n_game,
+                      "metrics": self.metrics.state_dict(),
+                      "rng": self.rng_state_dict(),
+                      "torch_rng": torch.get_rng_state(),
+                      "memory": include_memory}
+        torch.save(checkpoint, path + ".tmp")
+        os.replace(path + ".tmp", path)
 
-    def graph_results(self, score: int) -> None:
+    def load_checkpoint(self, path: str, include_memory: bool = True) -> None:
         """
-        Store and graph results of training
-        :param score: The current score
+        Restore the training state saved by save_checkpoint
+        :param path: path of the checkpoint file
+        :param include_memory: True to also restore the replay memory if it was saved
         :return: None
         """
-        self.scores.append(score)
-        self.score_means.append(np.mean(self.scores[-10:]))
-        # Graph every 5 games
-        if self.n_game % 5 == 0:
-            scores = np.array(self.scores)
-            n_game = np.arange(0, self.n_game)
-            plt.figure(1)
-            plt.title('Score vs. number of games')
-            plt.xlabel('Game number (n_game)')
-            plt.ylabel('Score')
-            plt.plot(n_game, scores, label="Score")
-            plt.plot(n_game, self.score_means, label="10 game average")
-            plt.legend()
-            plt.show()
+        import torch
+        checkpoint = torch.load(path)
+        self.model.load_state_dict(checkpoint["model"])
+        self.trainer.target_model.load_state_dict(checkpoint["target_model"])
+        self.trainer.optimizer.load_state_dict(checkpoint["optimizer"])
+        self.trainer.n_steps = checkpoint["train_steps"]
+        self.epsilon = checkpoint["epsilon"]
+        self.n_game = checkpoint["n_game"]
+        self.metrics.load_state_dict(checkpoint["metrics"])
+        self.load_rng_state_dict(checkpoint["rng"])
+        torch.set_rng_state(checkpoint["torch_rng"])
+        if include_memory and checkpoint["memory"]:
+            self.memory.load(path + ".memory.npz")
 
-            plt.pause(0.001)
+    def export_policy(self, path: str) -> None:
+        """
+        Save the model's weights for a NumpyPolicy, which plays without torch
+        :param path: path of the .npz file
+        :return: None
+        """
+        export_policy(self.model.state_dict(), path)
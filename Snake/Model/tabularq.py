@@ -0,0 +1,148 @@
+"""
+Author: Bruce Smith
+Date: August 24, 2023
+"""
+import json
+import os
+import numpy as np
+
+from Model.qagent import QAgent
+from Model.replaymemory import ReplayMemory, Transition
+from Model.snakedqn import DQNConfig
+
+# weight of each of the 11 binary state features in a state's index
+STATE_WEIGHTS = 1 << np.arange(11)
+# default hyperparameters of a TabularQAgent, which learns faster than the DQN
+TABULAR_CONFIG = DQNConfig(lr=0.1)
+# DQNConfig fields of the neural network, which a TabularQAgent has no use for
+NEURAL_FIELDS = ("hidden_n", "target_sync", "tau", "double")
+
+
+def state_index(states: np.ndarray) -> np.ndarray:
+    """
+    Pack binary states into integer indices
+    :param states: states with the 11 binary features of SnakeSimulation.get_state in the last axis
+    :return: index in [0, 2048) of each state
+    """
+    return np.asarray(states, dtype=np.int64) @ STATE_WEIGHTS
+
+
+class TabularQAgent(QAgent):
+    """
+    Q-learning agent keeping a 2048 x 3 table of action values, one row per possible
+    SnakeSimulation.get_state. Has the interface of SnakeDQN, so it can be used by Game
+    and TrainingRunner in its place, and acts and trains without torch.
+    """
+    def __init__(self, lr: float = 0.1, gamma: float = 0.97, prioritized: bool = False,
+                 memory: ReplayMemory = None, metrics_path: str = None, seed: int = None,
+                 memory_capacity: int = 10000, batch_size: int = 20, delta_epsilon: float = 1e-4,
+                 min_epsilon: float = 0.0001, n_step: int = 1) -> None:
+        """
+        Initialize the agent
+        :param lr: learning rate, the fraction of the TD error added to a value per update
+        :param gamma: discount rate
+        :param prioritized: True to sample replay memory by TD error instead of uniformly
+        :param memory: replay memory to use, None for a new in-memory one
+        :param metrics_path: CSV or JSONL file to log game results to, None to keep no log
+        :param seed: seed for exploration and the replay memory it creates, None for random
+        :param memory_capacity: number of transitions the replay memory it creates holds
+        :param batch_size: number of transitions per train_long_memory sample
+        :param delta_epsilon: decrease of the exploration rate per action
+        :param min_epsilon: lowest exploration rate
+        :param n_step: number of moves whose rewards are summed into each replayed transition (see NStepBuffer)
+        """
+        super().__init__(gamma, prioritized, memory, metrics_path, seed, len(STATE_WEIGHTS), memory_capacity,
+                         batch_size, delta_epsilon, min_epsilon, n_step)
+        self.q_table = np.zeros((1 << len(STATE_WEIGHTS), 3))
+        self.lr = lr
+        self.n_train_steps = 0
+        self.config = TABULAR_CONFIG._replace(lr=lr, gamma=gamma, memory_capacity=memory_capacity,
+                                              batch_size=batch_size, delta_epsilon=delta_epsilon,
+                                              min_epsilon=min_epsilon, prioritized=self.prioritized, n_step=n_step)
+
+    @classmethod
+    def from_config(cls, config: DQNConfig, **kwargs) -> "TabularQAgent":
+        """
+        Create an agent with the hyperparameters of a config
+        :param config: hyperparameters, leaving the neural network fields at their defaults
+        :param kwargs: other arguments of TabularQAgent.__init__, e.g. memory or seed
+        :return: The agent
+        """
+        neural = [name for name in NEURAL_FIELDS if getattr(config, name) != DQNConfig._field_defaults[name]]
+        if neural:
+            raise ValueError("a TabularQAgent has no hidden layer or target network, cannot set {}".format(neural))
+        return cls(**{name: value for name, value in config._asdict().items() if name not in NEURAL_FIELDS},
+                   **kwargs)
+
+    @staticmethod
+    def checkpoint_config(path: str) -> DQNConfig | None:
+        """
+        Get the hyperparameters a checkpoint was saved with
+        :param path: path of the checkpoint file
+        :return: The config, None for checkpoints saved without one
+        """
+        with np.load(path) as checkpoint:
+            if "config" not in checkpoint.files:
+                return None
+            return DQNConfig(**json.loads(str(checkpoint["config"])))
+
+    def greedy_actions(self, states: np.ndarray) -> np.ndarray:
+        """
+        Get the action with the highest value in the table for each state
+        :param states: The states of the GameBoards, one per board
+        :return: An array of action indices
+        """
+        return np.argmax(self.q_table[state_index(states)], axis=1)
+
+    def train_batch(self, batch: Transition, weights: np.ndarray = None, gamma: float = None) -> np.ndarray:
+        """
+        Move the values of the batch's state-action pairs towards their Q-learning targets
+        :param batch: a Transition of batch arrays (see ReplayMemory.get_batch)
+        :param weights: importance-sampling weight per transition, None to weigh them equally
+        :param gamma: discount of the next state's value, None for the agent's gamma
+        :return: TD error of each transition
+        """
+        gamma = self.gamma if gamma is None else gamma
+        idx = state_index(batch.state)
+        next_q = self.q_table[state_index(batch.next_state)].max(axis=1)
+        td_errors = batch.reward + gamma * next_q * (1 - batch.done) - self.q_table[idx, batch.action]
+        step = self.lr * td_errors if weights is None else self.lr * weights * td_errors
+        # repeated pairs in a batch each add their step
+        np.add.at(self.q_table, (idx, batch.action), step)
+        self.n_train_steps += 1
+        return td_errors
+
+    def save_checkpoint(self, path: str, include_memory: bool = False) -> None:
+        """
+        Atomically save the training state (config, Q-table, epsilon, game count, score statistics and random
+        number generators)
+        :param path: path of the checkpoint file
+        :param include_memory: True to also save the replay memory to path + ".memory.npz"
+        :return: None
+        """
+        if include_memory:
+            self.memory.save(path + ".memory.npz")
+        self.metrics.flush()
+        with open(path + ".tmp", "wb") as file:
+            np.savez(file, config=json.dumps(self.config._asdict()), q_table=self.q_table, epsilon=self.epsilon,
+                     n_game=self.n_game, train_steps=self.n_train_steps, metrics=json.dumps(self.metrics.state_dict()),
+                     rng=json.dumps(self.rng_state_dict()), memory=include_memory)
+        os.replace(path + ".tmp", path)
+
+    def load_checkpoint(self, path: str, include_memory: bool = True) -> None:
+        """
+        Restore the training state saved by save_checkpoint
+        :param path: path of the checkpoint file
+        :param include_memory: True to also restore the replay memory if it was saved
+        :return: None
+        """
+        with np.load(path) as checkpoint:
+            self.q_table[:] = checkpoint["q_table"]
+            self.epsilon = float(checkpoint["epsilon"])
+            self.n_game = int(checkpoint["n_game"])
+            self.n_train_steps = int(checkpoint["train_steps"])
+            self.metrics.load_state_dict(json.loads(str(checkpoint["metrics"])))
+            self.load_rng_state_dict(json.loads(str(checkpoint["rng"])))
+            saved_memory = bool(checkpoint["memory"])
+        if include_memory and saved_memory:
+            self.memory.load(path + ".memory.npz")